@@ -1,81 +1,498 @@
+import asyncio
+import io
 import os
+import hashlib
 import json
 import requests
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
 import tempfile
 import re
-from langdetect import detect, DetectorFactory
+import time
+import unicodedata
+import zipfile
+from xml.etree import ElementTree
+from collections import Counter
+from contextlib import ExitStack, closing, contextmanager
+from functools import partial
+from .ocr import get_ocr_engine
+from .compaction import PAGE_BREAK, compact_cv_text
+from .json_stream import JSONArrayStream
+from .llm_output import (
+    describe, normalize_question, normalize_text_item, parse_array, parse_object, question_stem,
+)
+from .llm_client import LLMError, get_async_llm_client, get_llm_client
+from .pipeline import run_steps
+
+# Load API key (read by the LLM client)
+load_dotenv()
 
-# Ensure consistent language detection
-DetectorFactory.seed = 0
+# Characters of CV text extracted per document; compact_cv_text then picks what
+# goes into a prompt (CV_PROMPT_TOKENS), so this only bounds extraction work
+CV_TEXT_BUDGET = 12000
 
-# Load API key
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-print(" API Key Loaded:", GROQ_API_KEY)
+# Text-layer pages with fewer characters than this are treated as scanned
+MIN_PAGE_CHARS = 25
+_CID_RE = re.compile(r"\(cid:\d+\)")
+# Latin/digit runs inside a reversed Arabic line (emails, dates, phone numbers)
+_LTR_RUN_RE = re.compile(r"[0-9A-Za-z](?:[0-9A-Za-z@._+:/-]| (?=[0-9A-Za-z]))*")
+
+# Arabic-script share of letters at or above which a CV is Arabic, at or below which it is English;
+# anything in between is left to langdetect
+ARABIC_SCRIPT_RATIO = 0.65
+LATIN_SCRIPT_RATIO = 0.15
+LANGUAGE_SAMPLE_CHARS = 1000
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_EP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
 
 #  Extract Text
-def extract_text_from_pdf(file):
-    """Extract text from a PDF file (supports OCR for scanned resumes)."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        for chunk in file.chunks():
-            tmp_file.write(chunk)
-        temp_path = tmp_file.name
+def _file_source(file):
+    """
+    Resolve an uploaded or stored file to something the extractors can read without copying it:
+    an existing filesystem path when there is one, otherwise a seekable in-memory buffer.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return file
+    if isinstance(file, io.BytesIO):
+        file.seek(0)
+        return file
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return io.BytesIO(file)
+
+    # TemporaryUploadedFile: Django already spooled the upload to disk
+    if hasattr(file, "temporary_file_path"):
+        return file.temporary_file_path()
+
+    # FieldFile on local storage
+    try:
+        path = file.path
+    except (AttributeError, NotImplementedError, ValueError):
+        path = None
+    if path and os.path.exists(path):
+        return path
+
+    # InMemoryUploadedFile keeps the upload in a BytesIO we can read in place
+    buffer = getattr(file, "file", None)
+    if isinstance(buffer, io.BytesIO):
+        buffer.seek(0)
+        return buffer
 
+    # Remote storage or any other file-like object
+    return io.BytesIO(b"".join(file.chunks()))
+
+
+@contextmanager
+def _pdf_path(source):
+    """Yield a filesystem path for tools that need one (poppler), spooling in-memory sources only."""
+    if isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp_file:
+        tmp_file.write(source.getbuffer())
+        tmp_file.flush()
+        yield tmp_file.name
+
+
+def _read_until_budget(pages, max_chars):
+    """Concatenate lazily produced page texts, stopping as soon as max_chars is reached."""
     text = ""
+    with closing(pages):
+        for page_text in pages:
+            text += page_text
+            if max_chars and len(text) >= max_chars:
+                break
+    return text
+
+
+def _is_presentation_form(ch):
+    return "\ufb50" <= ch <= "\ufdff" or "\ufe70" <= ch <= "\ufeff"
+
+
+def _glyph_form(ch):
+    name = unicodedata.name(ch, "")
+    for form in ("INITIAL", "MEDIAL", "FINAL", "ISOLATED"):
+        if name.endswith(f"{form} FORM"):
+            return form
+    return None
+
+
+def _is_visual_order(text):
+    """
+    Whether presentation-form words are stored reversed (visual order): their first
+    glyph is then a final form and their last an initial form.
+    """
+    reversed_votes = logical_votes = 0
+    for word in text.split():
+        glyphs = [ch for ch in word if _is_presentation_form(ch)]
+        if len(glyphs) < 2:
+            continue
+        first, last = _glyph_form(glyphs[0]), _glyph_form(glyphs[-1])
+        if first == "FINAL" or last == "INITIAL":
+            reversed_votes += 1
+        elif first == "INITIAL" or last == "FINAL":
+            logical_votes += 1
+    return reversed_votes > logical_votes
+
+
+def _repair_presentation_forms(text):
+    """
+    Turn a text layer of Arabic presentation-form glyphs into logical-order base letters.
+    Reversed lines are flipped back (keeping Latin and digit runs readable) before NFKC,
+    so lam-alef ligatures expand in the right order.
+    """
+    if _is_visual_order(text):
+        text = "\n".join(_LTR_RUN_RE.sub(lambda m: m.group(0)[::-1], line[::-1]) for line in text.split("\n"))
+    return unicodedata.normalize("NFKC", text)
+
+
+def _text_layer_problem(text):
+    """
+    Classify one page's embedded text. Returns None when it is usable, otherwise why
+    the page cannot be used as it is: 'empty', 'cid' ((cid:NN) glyph junk),
+    'presentation_forms' (Arabic glyph forms, often reversed; repaired with
+    _repair_presentation_forms rather than OCR'd) or 'garbled'.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_PAGE_CHARS:
+        return "empty"
+
+    cid_chars = sum(len(m) for m in _CID_RE.findall(stripped))
+    if cid_chars > 0.1 * len(stripped):
+        return "cid"
+
+    letters = [ch for ch in stripped if ch.isalpha()]
+    if sum(1 for ch in letters if _is_presentation_form(ch)) > 0.3 * len(letters):
+        return "presentation_forms"
+
+    non_space = sum(1 for ch in stripped if not ch.isspace())
+    if stripped.count("\ufffd") > 0.05 * non_space or len(letters) < 0.25 * non_space:
+        return "garbled"
+    return None
+
+
+def _has_images(page, depth=0):
+    """Whether the page draws any image XObject (directly or inside a form XObject)."""
     try:
-        reader = PdfReader(temp_path)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-
-        if not text.strip():
-            print(" No text detected — switching to OCR mode...")
-            images = convert_from_path(temp_path)
-            for img in images:
-                text += pytesseract.image_to_string(img)
-
-        print(" Extracted text preview:", text[:400])
-        return text[:4000]
-    finally:
-        os.remove(temp_path)
+        resources = page.get('/Resources')
+        xobjects = resources.get_object().get('/XObject') if resources else None
+        if not xobjects:
+            return False
+        for ref in xobjects.get_object().values():
+            xobject = ref.get_object()
+            subtype = xobject.get('/Subtype')
+            if subtype == '/Image':
+                return True
+            if subtype == '/Form' and depth < 3 and _has_images(xobject, depth + 1):
+                return True
+    except Exception:
+        return False
+    return False
+
+
+def _page_problem(text, lang):
+    """
+    _text_layer_problem for a page about to be OCR'd in lang: a mostly Arabic text layer
+    is kept as it is when the OCR language cannot read Arabic, since tesseract would
+    replace it with Latin junk.
+    """
+    problem = _text_layer_problem(text)
+    if problem not in (None, "empty") and "ara" not in lang.split("+") and _arabic_share(text) >= 0.5:
+        return None
+    return problem
+
+
+def _needs_ocr(page, problem):
+    """
+    An empty text layer only means a scan if the page has an image on it (a blank page
+    or a bare page number doesn't); a junk text layer still has glyphs OCR can read.
+    """
+    if problem is None:
+        return False
+    return problem != "empty" or _has_images(page)
+
+
+def _iter_hybrid_pages(reader, source, stats):
+    """
+    Yield page texts in order, each ending in PAGE_BREAK, keeping the text layer where
+    it is usable and OCR'ing only the pages where it is missing or junk. Pages are
+    classified a window at a time so the pages that need OCR within a window run in parallel.
+    """
+    engine = get_ocr_engine()
+    total = len(reader.pages)
+
+    with ExitStack() as stack:
+        pdf_path = None
+        for start in range(0, total, engine.window):
+            window = []
+            for n in range(start, min(start + engine.window, total)):
+                text = reader.pages[n].extract_text() or ""
+                if _text_layer_problem(text) == "presentation_forms":
+                    # Readable once normalized; OCR would need Arabic language data to do better
+                    text = _repair_presentation_forms(text)
+                window.append((n, text))
+            problems = {n: _page_problem(text, engine.lang) for n, text in window}
+
+            to_ocr = [n for n, _ in window if _needs_ocr(reader.pages[n], problems[n])]
+            if engine.max_pages:
+                to_ocr = to_ocr[:max(0, engine.max_pages - stats['ocr_pages'])]
+
+            ocr_text = {}
+            if to_ocr:
+                if pdf_path is None:
+                    pdf_path = stack.enter_context(_pdf_path(source))
+                try:
+                    pages = engine.iter_pages(pdf_path, pages=[n + 1 for n in to_ocr], reader=reader)
+                    ocr_text = dict(zip(to_ocr, pages))
+                    stats['ocr_pages'] += len(to_ocr)
+                except Exception as e:
+                    # Keep the text layer rather than losing an otherwise readable CV
+                    print(f" OCR failed for pages {[n + 1 for n in to_ocr]}: {e}")
+
+            for n, text in window:
+                stats['pages_read'] += 1
+                if ocr_text.get(n, "").strip():
+                    text = ocr_text[n]
+                elif problems[n] not in (None, "empty"):
+                    # Junk text layer that could not be OCR'd; never feed it to the model
+                    text = ""
+                # Compaction uses page breaks to tell page headers/footers from body text
+                yield text + PAGE_BREAK
+
+
+def file_sha256(file):
+    """SHA-256 of the file bytes, read from the same path or buffer the extractor uses."""
+    source = _file_source(file)
+    digest = hashlib.sha256()
+    if isinstance(source, io.BytesIO):
+        digest.update(source.getbuffer())
+        return digest.hexdigest()
+
+    with open(source, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_pdf(file, max_chars=CV_TEXT_BUDGET):
+    """
+    Extract text from a PDF file (supports OCR for scanned resumes).
+    Pages are read lazily and extraction stops once max_chars characters are
+    collected; pass max_chars=None to read the whole document. Only pages with a
+    missing or unusable text layer are OCR'd.
+    Returns a dict with the text, the page count, the pages read before the budget
+    was met and the method used ('text', 'ocr' or 'hybrid').
+    """
+    source = _file_source(file)
+
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(source)
+    page_count = len(reader.pages)
+    stats = {'pages_read': 0, 'ocr_pages': 0}
+    text = _read_until_budget(_iter_hybrid_pages(reader, source, stats), max_chars)
+
+    if stats['ocr_pages'] == 0:
+        method = "text"
+    elif stats['ocr_pages'] >= stats['pages_read']:
+        method = "ocr"
+    else:
+        method = "hybrid"
+    if stats['ocr_pages']:
+        print(f" OCR'd {stats['ocr_pages']} of {stats['pages_read']} pages read")
+
+    print(" Extracted text preview:", text[:400])
+    return {
+        'text': text[:max_chars] if max_chars else text,
+        'page_count': page_count,
+        'pages_read': stats['pages_read'],
+        'method': method,
+        'truncated': bool(max_chars) and len(text) >= max_chars,
+    }
 
 
-# Detect Language from CV
-def detect_cv_language(cv_text):
-    """Detect the primary language of the CV (English or Arabic)."""
+def extract_text_from_pdf(file, max_chars=CV_TEXT_BUDGET):
+    """Extract text from a PDF file (supports OCR for scanned resumes)."""
+    return extract_pdf(file, max_chars)['text']
+
+
+def _file_format(file, source):
+    """Detect 'pdf' or 'docx' from the file's magic bytes, falling back to its extension."""
+    if isinstance(source, io.BytesIO):
+        head = bytes(source.getbuffer()[:4])
+    else:
+        with open(source, "rb") as fh:
+            head = fh.read(4)
+
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"
+
+    name = getattr(file, "name", None) or (source if isinstance(source, (str, os.PathLike)) else "")
+    return "docx" if os.path.splitext(str(name))[1].lower() == ".docx" else "pdf"
+
+
+def _iter_docx_paragraphs(source):
+    """
+    Stream paragraphs out of word/document.xml without loading the document tree;
+    each paragraph element is cleared as soon as its text has been emitted.
+    """
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as xml_stream:
+        parts = []
+        for _, elem in ElementTree.iterparse(xml_stream, events=("end",)):
+            tag = elem.tag
+            if tag == _W_NS + "t":
+                parts.append(elem.text or "")
+            elif tag == _W_NS + "tab":
+                parts.append("\t")
+            elif tag in (_W_NS + "br", _W_NS + "cr"):
+                parts.append("\n")
+            elif tag == _W_NS + "p":
+                yield "".join(parts) + "\n"
+                parts = []
+                elem.clear()
+
+
+def _docx_page_count(source):
+    """Page count recorded by Word in docProps/app.xml (0 when missing)."""
     try:
-        # Clean text and detect language
-        cleaned_text = cv_text.strip()[:1000]  # Use first 1000 chars for detection
-        detected_lang = detect(cleaned_text)
+        with zipfile.ZipFile(source) as archive:
+            root = ElementTree.fromstring(archive.read("docProps/app.xml"))
+        pages = root.find(_EP_NS + "Pages")
+        return int(pages.text) if pages is not None and pages.text else 0
+    except (KeyError, ValueError, ElementTree.ParseError):
+        return 0
+
+
+def extract_docx(file, max_chars=CV_TEXT_BUDGET):
+    """
+    Extract text from a DOCX file by streaming its XML, stopping once max_chars is reached.
+    Returns the same dict shape as extract_pdf.
+    """
+    source = _file_source(file)
+    text = _read_until_budget(_iter_docx_paragraphs(source), max_chars)
+    if isinstance(source, io.BytesIO):
+        source.seek(0)
+
+    print(" Extracted text preview:", text[:400])
+    return {
+        'text': text[:max_chars] if max_chars else text,
+        'page_count': _docx_page_count(source),
+        'method': "docx",
+        'truncated': bool(max_chars) and len(text) >= max_chars,
+    }
+
+
+def extract_document(file, max_chars=CV_TEXT_BUDGET):
+    """Extract text from a PDF or DOCX CV, dispatching on the file format."""
+    source = _file_source(file)
+    if _file_format(file, source) == "docx":
+        return extract_docx(source, max_chars)
+    return extract_pdf(source, max_chars)
+
 
-        # Map to supported languages
-        if detected_lang == 'ar':
-            return 'ar'
+def extract_text(file, max_chars=CV_TEXT_BUDGET):
+    """Extract text from a PDF or DOCX CV."""
+    return extract_document(file, max_chars)['text']
+
+
+# Detect Language from CV
+def _is_arabic_script(ch):
+    return ("\u0600" <= ch <= "\u06ff" or "\u0750" <= ch <= "\u077f"
+            or "\u08a0" <= ch <= "\u08ff" or _is_presentation_form(ch))
+
+
+def _arabic_share(text):
+    """Share of the letters in text that are Arabic script."""
+    letters = [ch for ch in text if ch.isalpha()]
+    return sum(1 for ch in letters if _is_arabic_script(ch)) / len(letters) if letters else 0.0
+
+
+def _langdetect():
+    """Import langdetect on first use; its profiles load lazily on the first detection."""
+    from langdetect import detect_langs, DetectorFactory
+
+    # Ensure consistent language detection
+    DetectorFactory.seed = 0
+    return detect_langs
+
+
+def detect_language_details(cv_text):
+    """
+    Detect the primary language of the CV (English or Arabic) in tiers:
+    the share of Arabic-script letters decides clear cases, and langdetect
+    only runs when the script mix is ambiguous.
+    Returns language, confidence (0-1), the tier that decided ('script',
+    'langdetect' or 'default') and the time taken in milliseconds.
+    """
+    started = time.perf_counter()
+    sample = cv_text.strip()[:LANGUAGE_SAMPLE_CHARS]
+
+    arabic = latin = 0
+    for ch in sample:
+        if _is_arabic_script(ch):
+            arabic += 1
+        elif ch.isalpha():
+            latin += 1
+
+    language, confidence, method = 'en', 0.0, 'default'
+    if arabic + latin:
+        arabic_share = arabic / (arabic + latin)
+        if arabic_share >= ARABIC_SCRIPT_RATIO:
+            language, confidence, method = 'ar', arabic_share, 'script'
+        elif arabic_share <= LATIN_SCRIPT_RATIO:
+            language, confidence, method = 'en', 1 - arabic_share, 'script'
         else:
-            return 'en'  # Default to English
-    except Exception as e:
-        print(f"Language detection error: {e}")
-        return 'en'  # Default to English on error
+            try:
+                best = _langdetect()(sample)[0]
+                language = 'ar' if best.lang == 'ar' else 'en'
+                confidence, method = best.prob, 'langdetect'
+            except Exception as e:
+                print(f"Language detection error: {e}")
+                language = 'ar' if arabic_share >= 0.5 else 'en'
+                confidence, method = max(arabic_share, 1 - arabic_share), 'script'
+
+    return {
+        'language': language,
+        'confidence': round(confidence, 3),
+        'method': method,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def detect_cv_language(cv_text):
+    """Detect the primary language of the CV (English or Arabic)."""
+    return detect_language_details(cv_text)['language']
 
 
 # Extract CV Information using AI
-def extract_cv_information(cv_text):
-    """Extract name, phone, city, and job titles from CV using Groq AI."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+# Lower temperature for more precise extraction
+EXTRACT_INFO_CALL = {'task': 'extract_info', 'prompt_version': 1, 'temperature': 0.3, 'max_tokens': 500, 'timeout': 30}
+# With less time than this left, don't start the Groq call; the regex fallback answers instantly
+EXTRACT_INFO_MIN_TIMEOUT = 3
+
+
+def extract_cv_information(cv_text, timeout=None):
+    """
+    Extract name, phone, city, and job titles from CV using Groq AI.
+    `timeout` caps the Groq call (e.g. to what is left of the upload's deadline).
+    """
+    call = dict(EXTRACT_INFO_CALL)
+    if timeout is not None:
+        if timeout < EXTRACT_INFO_MIN_TIMEOUT:
+            print(f" Only {timeout:.1f}s left; skipping the Groq info call")
+            return extract_cv_info_fallback(cv_text)
+        call['timeout'] = min(call['timeout'], timeout)
 
+    # Contact lines are what this prompt is after, so compaction keeps them and spends the budget on the header first
+    compact_text = compact_cv_text(cv_text, keep_contact=True)
     prompt = f"""
 You are an expert CV parser. Extract the following information from this CV:
 
 CV Content:
 ---
-{cv_text}
+{compact_text}
 ---
 
 Extract and return ONLY a JSON object with these fields:
@@ -95,41 +512,25 @@ Return ONLY pure JSON in this exact format:
 Do NOT include any markdown, explanations, or extra text. Just the JSON object.
 """
 
-    data = {
-        "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.3,  # Lower temperature for more precise extraction
-        "max_tokens": 500,
-        "top_p": 0.9
-    }
-
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-
-        if response.status_code == 200:
-            content = response.json()["choices"][0]["message"]["content"]
-            print(" Raw extraction output:", content[:300])
+        content = get_llm_client().chat(prompt, **call)
+        print(" Raw extraction output:", content[:300])
 
-            # Clean and parse JSON
-            match = re.search(r"\{.*\}", content, re.DOTALL)
-            if match:
-                content = match.group(0).strip()
-
-            try:
-                extracted_data = json.loads(content)
-                return {
-                    'name': extracted_data.get('name', ''),
-                    'phone': extracted_data.get('phone', ''),
-                    'city': extracted_data.get('city', ''),
-                    'job_titles': extracted_data.get('job_titles', [])[:3]  # Limit to 3 titles
-                }
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing failed: {e}")
-                # Attempt basic regex extraction as fallback
-                return extract_cv_info_fallback(cv_text)
-        else:
-            print(f" Groq API Error ({response.status_code}): {response.text}")
+        extracted_data, _ = parse_object(content)
+        if extracted_data is None:
+            print("JSON parsing failed")
+            # Attempt basic regex extraction as fallback
             return extract_cv_info_fallback(cv_text)
+        job_titles = extracted_data.get('job_titles') or []
+        return {
+            'name': extracted_data.get('name', ''),
+            'phone': extracted_data.get('phone', ''),
+            'city': extracted_data.get('city', ''),
+            'job_titles': [t for t in job_titles if isinstance(t, str)][:3]  # Limit to 3 titles
+        }
+    except LLMError as e:
+        print(f" {e}: {e.body}")
+        return extract_cv_info_fallback(cv_text)
     except Exception as e:
         print(f"Error extracting CV information: {e}")
         return extract_cv_info_fallback(cv_text)
@@ -179,14 +580,26 @@ def detect_city_from_ip(ip_address):
 
 
 # Generate Questions (Multilingual)
-def generate_questions_from_cv(cv_text, language='en'):
-    """Send resume text to Groq API and generate professional questions in specified language."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
+QUIZ_DIFFICULTY_COUNTS = {'easy': 5, 'intermediate': 5, 'advanced': 5}
+# Follow-up calls that ask only for the questions a reply was short of
+QUIZ_TOPUP_ROUNDS = int(os.getenv("QUIZ_TOPUP_ROUNDS", "1"))
+# A top-up prompt gets less CV text; the skills section is what matters for a few questions
+TOPUP_CV_TOKENS = 400
+# 'single': one call for the whole quiz; 'sharded': one parallel call per difficulty
+QUIZ_GENERATION_MODE = os.getenv("QUIZ_GENERATION_MODE", "single")
+# Sharded generation gives up on shards still running after this many seconds
+QUIZ_SHARD_DEADLINE = float(os.getenv("QUIZ_SHARD_DEADLINE", "60"))
+
+
+def _questions_prompt(cv_text, language, counts=None, exclude=None, cv_tokens=None):
+    counts = counts or QUIZ_DIFFICULTY_COUNTS
+    total = sum(counts.values())
+    mix = ", ".join(f"{n} {difficulty}" for difficulty, n in counts.items() if n)
+    cv_text = compact_cv_text(cv_text, max_tokens=cv_tokens) if cv_tokens else compact_cv_text(cv_text)
+    # Questions already accepted, so a top-up does not repeat them
+    avoid = "".join(f"\n  - {q['question'][:120]}" for q in exclude or [])
+    if avoid:
+        avoid = f"\n- Do not repeat or rephrase any of these questions:{avoid}"
     # Language-specific instructions
     if language == 'ar':
         lang_instruction = """
@@ -198,7 +611,9 @@ def generate_questions_from_cv(cv_text, language='en'):
   {{
     "question": "ما هو...؟",
     "options": ["الخيار أ", "الخيار ب", "الخيار ج", "الخيار د"],
-    "answer": "الإجابة الصحيحة"
+    "answer": "الإجابة الصحيحة",
+    "difficulty": "easy",
+    "skill": "المهارة"
   }}
 ]
 """
@@ -209,7 +624,9 @@ def generate_questions_from_cv(cv_text, language='en'):
   {{
     "question": "Example question...",
     "options": ["Option A", "Option B", "Option C", "Option D"],
-    "answer": "Correct answer"
+    "answer": "Correct answer",
+    "difficulty": "easy",
+    "skill": "Skill tested"
   }}
 ]
 """
@@ -222,13 +639,14 @@ Analyze the following resume content carefully:
 {cv_text}
 ---
 Identify all technical, behavioral, and soft skills mentioned.
-Then generate 15 multiple-choice interview questions (MCQs) that evaluate
+Then generate {total} multiple-choice interview questions (MCQs) that evaluate
 the candidate's ability to apply these skills in real job settings.
 
 Rules:
-- Include 5 easy, 5 intermediate, 5 advanced questions.
+- Include {mix} questions.
 - Each question must have 4 options, 1 correct answer.
-- Avoid referencing the resume directly.
+- Set "difficulty" to easy, intermediate or advanced, and "skill" to the skill the question tests.
+- Avoid referencing the resume directly.{avoid}
 - Keep it professional and realistic.
 {lang_instruction}
 
@@ -237,52 +655,242 @@ Return ONLY pure JSON in this format:
 
 Do NOT include markdown, code blocks, or extra text.
 """
+    return prompt
+
+
+# Increased max_tokens for Arabic (longer text); sized for a full 15-question quiz
+QUESTIONS_CALL = {'task': 'quiz', 'prompt_version': 2, 'temperature': 0.8, 'max_tokens': 3500, 'timeout': 45}
+
+
+# max_tokens here is per 15 questions, as for QUESTIONS_CALL; _questions_call scales it down
+QUESTIONS_TOPUP_CALL = {'task': 'quiz_topup', 'prompt_version': 1, 'temperature': 0.8, 'max_tokens': 3500, 'timeout': 30}
+
+
+def _questions_call(counts, call=QUESTIONS_CALL):
+    """`call` with max_tokens scaled to the number of questions asked for."""
+    total = sum((counts or QUIZ_DIFFICULTY_COUNTS).values())
+    return {**call, 'max_tokens': max(600, call['max_tokens'] * total // 15)}
+
+
+def _topup_request(cv_text, language, missing, accepted):
+    """Prompt and call arguments asking for just the `missing` questions ({difficulty: n})."""
+    print(f" Topping up quiz: {missing}")
+    prompt = _questions_prompt(cv_text, language, missing, exclude=accepted, cv_tokens=TOPUP_CV_TOKENS)
+    return prompt, _questions_call(missing, QUESTIONS_TOPUP_CALL)
+
+
+def _accept_questions(questions, counts=None, accepted=None):
+    """
+    Add validated questions to `accepted` while their difficulty still has room,
+    skipping repeated stems; a question without a difficulty takes the one with the most room.
+    Returns (accepted, missing) where missing is {difficulty: n still needed}.
+    """
+    counts = counts or QUIZ_DIFFICULTY_COUNTS
+    accepted = list(accepted or [])
+    stems = {question_stem(q['question']) for q in accepted}
+    have = Counter(q['difficulty'] for q in accepted)
+    for q in questions:
+        stem = question_stem(q['question'])
+        difficulty = q['difficulty'] or max(counts, key=lambda d: counts[d] - have[d])
+        if stem in stems or have[difficulty] >= counts.get(difficulty, 0):
+            continue
+        stems.add(stem)
+        have[difficulty] += 1
+        accepted.append({**q, 'difficulty': difficulty})
+    missing = {d: n - have[d] for d, n in counts.items() if n > have[d]}
+    return accepted, missing
+
+
+def _shards(counts):
+    """The counts each generation call asks for: all of them, or one difficulty per call when sharded."""
+    if QUIZ_GENERATION_MODE != 'sharded':
+        return [counts]
+    return [{d: n} for d, n in (counts or QUIZ_DIFFICULTY_COUNTS).items() if n]
+
+
+def _generate_shard(client, cv_text, language, shard, fresh):
+    content = client.chat(_questions_prompt(cv_text, language, shard), fresh=fresh, **_questions_call(shard))
+    return _parse_questions(content)
+
+
+def _generate_first_pass(client, cv_text, language, counts, fresh):
+    """
+    Validated questions from one call, or from one call per difficulty run in
+    parallel (so latency is the slowest shard, not the whole quiz's output).
+    Raises LLMError if a single call fails; failed shards are just missing.
+    """
+    shards = _shards(counts)
+    if len(shards) == 1:
+        return _generate_shard(client, cv_text, language, shards[0], fresh)
+    steps = {next(iter(shard)): (partial(_generate_shard, client, cv_text, language, shard, fresh), [])
+             for shard in shards}
+    outcome = run_steps(steps, QUIZ_SHARD_DEADLINE, name="quiz-shards")
+    return [q for step in steps for q in outcome['results'].get(step, [])]
+
+
+async def _agenerate_first_pass(client, cv_text, language, counts, fresh):
+    """Async version of _generate_first_pass."""
+    async def generate(shard):
+        content = await client.chat(_questions_prompt(cv_text, language, shard), fresh=fresh, **_questions_call(shard))
+        return _parse_questions(content)
+
+    shards = _shards(counts)
+    if len(shards) == 1:
+        return await generate(shards[0])
+    results = await asyncio.gather(*(generate(shard) for shard in shards), return_exceptions=True)
+    questions = []
+    for shard, result in zip(shards, results):
+        if isinstance(result, Exception):
+            print(f" Quiz shard {shard} failed: {result}")
+            continue
+        questions += result
+    return questions
+
+
+async def _astream_first_pass(client, cv_text, language, counts, fresh):
+    """
+    Validated questions as they complete in the Groq stream(s); sharded streams run
+    concurrently and are interleaved. Raises if every stream failed.
+    """
+    shards = _shards(counts)
+    queue = asyncio.Queue()
+    errors = []
+
+    async def pump(shard):
+        parser = JSONArrayStream(validate=normalize_question)
+        try:
+            stream = client.stream_chat(
+                _questions_prompt(cv_text, language, shard), fresh=fresh, **_questions_call(shard))
+            async for chunk in stream:
+                for question in parser.feed(chunk):
+                    await queue.put(question)
+            report = parser.close()
+            if report['dropped'] or report['truncated']:
+                print(f" Streamed {report['kept']} questions ({describe(report)})")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(pump(shard)) for shard in shards]
+    try:
+        finished = 0
+        while finished < len(tasks):
+            question = await queue.get()
+            if question is None:
+                finished += 1
+            else:
+                yield question
+    finally:
+        for task in tasks:
+            task.cancel()
+    if len(errors) == len(shards):
+        raise errors[0]
+    for e in errors:
+        print(f" Quiz shard failed: {e}")
+
+
+def _parse_questions(content):
+    """Every complete question that passes validation; a truncated reply keeps the questions before the cut."""
+    print(" Raw model output:", content[:500])
+    questions, report = parse_array(content, validate=normalize_question)
+    if report['dropped'] or report['truncated']:
+        print(f" Kept {report['kept']} questions ({describe(report)})")
+    return questions
+
+
+def generate_questions_from_cv(cv_text, language='en', fresh=False, counts=None):
+    """
+    Send resume text to Groq API and generate professional questions in specified language.
+    `counts` ({difficulty: n}) defaults to QUIZ_DIFFICULTY_COUNTS.
+    The same CV gets the cached quiz back unless fresh=True.
+    Questions that were invalid, duplicated or cut off are replaced by a small follow-up call.
+    """
+    client = get_llm_client()
+    try:
+        questions = _generate_first_pass(client, cv_text, language, counts, fresh)
+    except LLMError as e:
+        print(f" {e}: {e.body}")
+        return []
+    questions, missing = _accept_questions(questions, counts)
 
-    data = {
-        "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.8,
-        "max_tokens": 3500,  # Increased for Arabic (longer text)
-        "top_p": 0.9
-    }
-
-    response = requests.post(url, headers=headers, json=data, timeout=45)
+    for _ in range(QUIZ_TOPUP_ROUNDS):
+        if not missing or not questions:
+            break
+        prompt, call = _topup_request(cv_text, language, missing, questions)
+        try:
+            content = client.chat(prompt, fresh=fresh, **call)
+        except LLMError as e:
+            print(f" Top-up failed: {e}")
+            break
+        questions, missing = _accept_questions(_parse_questions(content), counts, questions)
+    return questions
 
-    if response.status_code == 200:
-        content = response.json()["choices"][0]["message"]["content"]
-        print(" Raw model output:", content[:500])
 
-        match = re.search(r"\[.*\]", content, re.DOTALL)
-        if match:
-            content = match.group(0).strip()
+async def agenerate_questions_from_cv(cv_text, language='en', fresh=False, counts=None):
+    """Async version of generate_questions_from_cv, for async views."""
+    client = get_async_llm_client()
+    try:
+        questions = await _agenerate_first_pass(client, cv_text, language, counts, fresh)
+    except LLMError as e:
+        print(f" {e}: {e.body}")
+        return []
+    questions, missing = _accept_questions(questions, counts)
 
+    for _ in range(QUIZ_TOPUP_ROUNDS):
+        if not missing or not questions:
+            break
+        prompt, call = _topup_request(cv_text, language, missing, questions)
         try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            print("JSON parsing failed. Attempting cleanup...")
-            cleaned = content.strip().replace("```json", "").replace("```", "")
-            try:
-                return json.loads(cleaned)
-            except Exception:
-                print("\n Invalid JSON after cleanup:\n", cleaned[:500])
-                return []
-    else:
-        print(f" Groq API Error ({response.status_code}): {response.text}")
-        return []
+            content = await client.chat(prompt, fresh=fresh, **call)
+        except LLMError as e:
+            print(f" Top-up failed: {e}")
+            break
+        questions, missing = _accept_questions(_parse_questions(content), counts, questions)
+    return questions
+
+
+async def astream_questions_from_cv(cv_text, language='en', fresh=False, counts=None):
+    """
+    Yield each generated question as soon as its JSON object is complete in the Groq stream,
+    then any top-up questions replacing ones that were dropped.
+    Raises LLMError if the generation call (every shard, when sharded) fails.
+    """
+    client = get_async_llm_client()
+    accepted, missing = _accept_questions([], counts)
+    async for question in _astream_first_pass(client, cv_text, language, counts, fresh):
+        before = len(accepted)
+        accepted, missing = _accept_questions([question], counts, accepted)
+        if len(accepted) > before:
+            yield accepted[-1]
+
+    for _ in range(QUIZ_TOPUP_ROUNDS):
+        if not missing or not accepted:
+            break
+        prompt, call = _topup_request(cv_text, language, missing, accepted)
+        try:
+            content = await client.chat(prompt, fresh=fresh, **call)
+        except LLMError as e:
+            print(f" Top-up failed: {e}")
+            break
+        before = len(accepted)
+        accepted, missing = _accept_questions(_parse_questions(content), counts, accepted)
+        for question in accepted[before:]:
+            yield question
 
 
 # Generate Feedback
-def generate_feedback_from_ai(wrong_answers, percent):
-    """Generate professional feedback based on user's wrong answers."""
-    if not wrong_answers:
-        return "Excellent work! You answered all questions correctly. "
+PERFECT_SCORE_FEEDBACK = "Excellent work! You answered all questions correctly. "
+FEEDBACK_CALL = {'task': 'feedback', 'prompt_version': 1, 'temperature': 0.7, 'max_tokens': 1000, 'timeout': 30}
+
 
+def _feedback_prompt(wrong_answers, percent):
     summary = f"Score: {percent:.1f}%\nIncorrect answers:\n"
     for w in wrong_answers:
-        summary += f"- Question: {w['question']}\nYour answer: {w['chosen']}\nCorrect: {w['correct']}\n"
-
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+        # Graded answers stored with a result carry 'answer'/'correctAnswer' instead
+        chosen = w.get('chosen', w.get('answer', ''))
+        correct = w.get('correct', w.get('correctAnswer', ''))
+        summary += f"- Question: {w.get('question', '')}\nYour answer: {chosen}\nCorrect: {correct}\n"
 
     prompt = f"""
 You are a career coach and HR expert.
@@ -296,30 +904,40 @@ Write feedback that:
 - Gives clear, practical advice.
 - Encourages and motivates the candidate.
 """
+    return prompt
 
-    data = {
-    "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
-    "messages": [{"role": "user", "content": prompt}],
-    "temperature": 0.7,
-    "max_tokens": 1000,
-    "top_p": 0.9
-}
-    response = requests.post(url, headers=headers, json=data, timeout=30)
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        return f" Error while generating feedback: {response.text}"
+
+def generate_feedback_from_ai(wrong_answers, percent):
+    """Generate professional feedback based on user's wrong answers."""
+    if not wrong_answers:
+        return PERFECT_SCORE_FEEDBACK
+
+    try:
+        return get_llm_client().chat(_feedback_prompt(wrong_answers, percent), **FEEDBACK_CALL)
+    except LLMError as e:
+        return f" Error while generating feedback: {e.body or e}"
+
+
+async def astream_feedback_from_ai(wrong_answers, percent):
+    """Yield feedback text as Groq streams it. Raises LLMError if the call fails."""
+    if not wrong_answers:
+        yield PERFECT_SCORE_FEEDBACK
+        return
+
+    async for chunk in get_async_llm_client().stream_chat(_feedback_prompt(wrong_answers, percent), **FEEDBACK_CALL):
+        yield chunk
 
 
 # Voice Interview Functions
+INTERVIEW_QUESTIONS_CALL = {
+    'task': 'interview_questions', 'prompt_version': 1, 'temperature': 0.7, 'max_tokens': 1000, 'timeout': 30,
+}
+INTERVIEW_EVAL_CALL = {'task': 'interview_eval', 'prompt_version': 1, 'temperature': 0.5, 'max_tokens': 1500, 'timeout': 45}
+
+
 def generate_interview_questions(cv_text, language='en'):
     """Generate interview questions for voice interview based on CV."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
+    cv_text = compact_cv_text(cv_text)
     if language == 'ar':
         lang_instruction = "أنشئ 5 أسئلة مقابلة باللغة العربية"
         format_example = '["السؤال 1", "السؤال 2", "السؤال 3", "السؤال 4", "السؤال 5"]'
@@ -348,28 +966,14 @@ Return ONLY a JSON array of strings:
 No markdown, no explanations.
 """
 
-    data = {
-        "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,
-        "max_tokens": 1000,
-        "top_p": 0.9
-    }
-
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        if response.status_code == 200:
-            content = response.json()["choices"][0]["message"]["content"]
+        content = get_llm_client().chat(prompt, **INTERVIEW_QUESTIONS_CALL)
 
-            # Extract JSON array
-            match = re.search(r"\[.*\]", content, re.DOTALL)
-            if match:
-                content = match.group(0).strip()
-
-            return json.loads(content)
-        else:
-            print(f"Error generating questions: {response.text}")
-            return []
+        questions, _ = parse_array(content, item_type=str, validate=normalize_text_item)
+        return questions
+    except LLMError as e:
+        print(f"Error generating questions: {e.body or e}")
+        return []
     except Exception as e:
         print(f"Error: {e}")
         return []
@@ -396,12 +1000,6 @@ def transcribe_audio_whisper(audio_file_path):
 
 def evaluate_interview_response(transcription, questions, language='en'):
     """Evaluate voice interview responses and provide scores."""
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     if language == 'ar':
         eval_prompt = f"""
 قيّم هذه المقابلة الصوتية:
@@ -459,35 +1057,22 @@ Return ONLY JSON:
 }}
 """
 
-    data = {
-        "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
-        "messages": [{"role": "user", "content": eval_prompt}],
-        "temperature": 0.5,
-        "max_tokens": 1500,
-        "top_p": 0.9
-    }
-
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=45)
-        if response.status_code == 200:
-            content = response.json()["choices"][0]["message"]["content"]
-
-            # Extract JSON
-            match = re.search(r"\{.*\}", content, re.DOTALL)
-            if match:
-                content = match.group(0).strip()
-
-            evaluation = json.loads(content)
-            return {
-                'soft_skills_score': evaluation.get('soft_skills_score', 0),
-                'communication_score': evaluation.get('communication_score', 0),
-                'confidence_score': evaluation.get('confidence_score', 0),
-                'feedback': evaluation.get('feedback', ''),
-                'suggestions': evaluation.get('suggestions', '')
-            }
-        else:
-            print(f"Error evaluating interview: {response.text}")
+        content = get_llm_client().chat(eval_prompt, **INTERVIEW_EVAL_CALL)
+
+        evaluation, _ = parse_object(content)
+        if evaluation is None:
             return None
+        return {
+            'soft_skills_score': evaluation.get('soft_skills_score', 0),
+            'communication_score': evaluation.get('communication_score', 0),
+            'confidence_score': evaluation.get('confidence_score', 0),
+            'feedback': evaluation.get('feedback', ''),
+            'suggestions': evaluation.get('suggestions', '')
+        }
+    except LLMError as e:
+        print(f"Error evaluating interview: {e.body or e}")
+        return None
     except Exception as e:
         print(f"Error: {e}")
         return None
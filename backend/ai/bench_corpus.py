@@ -0,0 +1,180 @@
+"""
+Synthetic CV corpus for the extraction benchmarks
+Documents are generated in memory from a seed, so every run (and every commit)
+measures exactly the same bytes without network access or font files
+"""
+import io
+import random
+import zipfile
+from typing import List
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageDraw
+
+PAGE_SIZES = [1, 2, 5, 10, 20, 30]
+LINES_PER_PAGE = 40
+
+_WORDS = {
+    'en': {
+        'headings': ["Professional Summary", "Experience", "Skills", "Education", "Projects", "Certifications"],
+        'words': [
+            "developed", "managed", "designed", "implemented", "backend", "services", "Python", "Django",
+            "REST", "APIs", "PostgreSQL", "team", "of", "engineers", "cloud", "infrastructure", "AWS",
+            "improved", "performance", "by", "percent", "customers", "data", "pipelines", "React",
+            "frontend", "testing", "deployment", "Docker", "Kubernetes", "security", "analysis",
+            "reporting", "stakeholders", "agile", "delivery", "mentored", "junior", "developers",
+        ],
+        'name': "Jordan Example",
+        'contact': "Phone: +966 50 123 4567 | Email: jordan@example.com | Riyadh",
+    },
+    'ar': {
+        'headings': ["الملخص المهني", "الخبرات", "المهارات", "التعليم", "المشاريع", "الشهادات"],
+        'words': [
+            "مهندس", "برمجيات", "خبرة", "إدارة", "مشاريع", "تطوير", "تطبيقات", "الويب", "قواعد",
+            "البيانات", "فريق", "العمل", "تحليل", "أنظمة", "شبكات", "أمن", "المعلومات", "جامعة",
+            "الملك", "سعود", "الرياض", "جدة", "بكالوريوس", "علوم", "الحاسب", "مهارات", "التواصل",
+            "القيادة", "تحسين", "الأداء", "العملاء", "السحابية", "الخدمات", "تصميم", "واجهات",
+        ],
+        'name': "سارة المثال",
+        'contact': "الهاتف: 966501234567+ | البريد: sara@example.com | الرياض",
+    },
+}
+
+
+def cv_pages(language: str, pages: int, rng: random.Random) -> List[List[str]]:
+    """CV-like text: a header, then section headings and bullet lines, split into pages."""
+    vocab = _WORDS[language]
+    lines = [vocab['name'], vocab['contact']]
+    while len(lines) < pages * LINES_PER_PAGE:
+        lines.append(rng.choice(vocab['headings']))
+        for _ in range(rng.randint(4, 9)):
+            lines.append("- " + " ".join(rng.choice(vocab['words']) for _ in range(rng.randint(6, 12))))
+    lines = lines[:pages * LINES_PER_PAGE]
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+
+
+def text_pdf(pages: List[List[str]]) -> bytes:
+    """
+    Minimal PDF with a real text layer. Each distinct character gets a one-byte code
+    and a ToUnicode entry, so Arabic text extracts correctly without embedding a font.
+    """
+    chars = sorted({ch for page in pages for line in page for ch in line})
+    if len(chars) > 255:
+        raise ValueError("Too many distinct characters for a single-byte font")
+    codes = {ch: i + 1 for i, ch in enumerate(chars)}
+
+    cmap = (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CMapName /Bench def\n1 begincodespacerange\n<00> <FF>\nendcodespacerange\n"
+    )
+    for start in range(0, len(chars), 100):
+        chunk = chars[start:start + 100]
+        cmap += f"{len(chunk)} beginbfchar\n"
+        cmap += "".join(f"<{codes[ch]:02X}> <{ord(ch):04X}>\n" for ch in chunk)
+        cmap += "endbfchar\n"
+    cmap += "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n"
+
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /FirstChar 0 /LastChar 255 /ToUnicode 4 0 R >>",
+        4: _stream(cmap.encode("ascii")),
+    }
+    kids = []
+    for i, page in enumerate(pages):
+        page_id, content_id = 5 + 2 * i, 6 + 2 * i
+        ops = ["BT", "/F1 10 Tf", "14 TL", "50 760 Td"]
+        for line in page:
+            ops.append("<" + "".join(f"{codes[ch]:02X}" for ch in line) + "> Tj T*")
+        ops.append("ET")
+        objects[content_id] = _stream("\n".join(ops).encode("ascii"))
+        objects[page_id] = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = out.tell()
+        body = objects[obj_id]
+        out.write(f"{obj_id} 0 obj\n".encode("ascii"))
+        out.write(body if isinstance(body, bytes) else body.encode("ascii"))
+        out.write(b"\nendobj\n")
+    xref = out.tell()
+    size = max(objects) + 1
+    out.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode("ascii"))
+    for obj_id in range(1, size):
+        out.write(f"{offsets.get(obj_id, 0):010d} 00000 n \n".encode("ascii"))
+    out.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+    return out.getvalue()
+
+
+def _stream(data: bytes) -> bytes:
+    return b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+
+def scanned_pdf(pages: List[List[str]], dpi: int = 150) -> bytes:
+    """Image-only PDF: each page is a grayscale raster of the text, with no text layer."""
+    images = []
+    for page in pages:
+        img = Image.new("L", (int(8.5 * dpi), int(11 * dpi)), 255)
+        draw = ImageDraw.Draw(img)
+        for i, line in enumerate(page):
+            draw.text((dpi // 2, dpi // 2 + i * (dpi // 4)), line, fill=0)
+        images.append(img)
+
+    out = io.BytesIO()
+    images[0].save(out, "PDF", save_all=True, append_images=images[1:], resolution=dpi)
+    return out.getvalue()
+
+
+def docx(pages: List[List[str]]) -> bytes:
+    """DOCX with one paragraph per line and the page count recorded in docProps/app.xml."""
+    body = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>'
+        for page in pages for line in page
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    app = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+        f'<Pages>{len(pages)}</Pages></Properties>'
+    )
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="UTF-8"?><Types/>')
+        archive.writestr("word/document.xml", document)
+        archive.writestr("docProps/app.xml", app)
+    return out.getvalue()
+
+
+def build_corpus(seed: int = 0, page_sizes: List[int] = PAGE_SIZES, scanned: bool = True) -> List[dict]:
+    """
+    Every combination of language, page count and format:
+    text-layer PDF, scanned PDF (if requested) and DOCX.
+    """
+    corpus = []
+    for language in ("en", "ar"):
+        for pages in page_sizes:
+            rng = random.Random(f"{seed}-{language}-{pages}")
+            text = cv_pages(language, pages, rng)
+            kinds = [("pdf-text", text_pdf), ("docx", docx)]
+            if scanned:
+                kinds.append(("pdf-scanned", scanned_pdf))
+            for kind, build in kinds:
+                corpus.append({
+                    'name': f"{kind}-{language}-{pages:02d}p",
+                    'kind': kind,
+                    'language': language,
+                    'pages': pages,
+                    'data': build(text),
+                })
+    return corpus
@@ -0,0 +1,196 @@
+"""
+Compaction of extracted CV text before it goes into a prompt
+Normalizes whitespace, drops page numbers, headers/footers repeated at the
+edges of pages and (optionally) contact lines, then keeps whole CV sections by priority -
+skills and experience first - until the token budget is spent
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+
+# Tokens of CV text a prompt gets after compaction
+CV_PROMPT_TOKENS = int(os.getenv("CV_PROMPT_TOKENS", "1200"))
+
+# PDF extraction separates pages with this character
+PAGE_BREAK = "\f"
+# A short line among the first/last EDGE_LINES of this many pages is a page header or footer
+REPEATED_LINE_MIN = 2
+EDGE_LINES = 2
+HEADER_MAX_CHARS = 80
+
+# Sections are kept in this order while the budget lasts. 'header' is the text
+# above the first recognized heading; unrecognized headings stay in the section before them
+SECTION_PRIORITY = ['skills', 'experience', 'header', 'summary', 'projects', 'certifications',
+                    'education', 'languages', 'interests', 'references']
+# With keep_contact the header (name, phone, city) is what the prompt is after, so it goes first
+CONTACT_SECTION_PRIORITY = ['header'] + [s for s in SECTION_PRIORITY if s != 'header']
+# Heading keywords (English and Arabic) per section
+SECTION_HEADINGS = {
+    'skills': ["skills", "technical skills", "core competencies", "competencies", "technologies",
+               "tools", "expertise", "المهارات", "مهارات", "المهارات التقنية"],
+    'experience': ["experience", "work experience", "professional experience", "employment",
+                   "employment history", "work history", "career history", "الخبرات", "الخبرة",
+                   "الخبرات العملية", "الخبرة العملية"],
+    'summary': ["summary", "professional summary", "profile", "about me", "objective", "career objective",
+                "الملخص", "الملخص المهني", "نبذة", "الهدف الوظيفي"],
+    'projects': ["projects", "key projects", "المشاريع", "مشاريع"],
+    'certifications': ["certifications", "certificates", "licenses", "courses", "training",
+                       "الشهادات", "الدورات", "الدورات التدريبية"],
+    'education': ["education", "academic background", "qualifications", "التعليم", "المؤهلات"],
+    'languages': ["languages", "اللغات"],
+    'interests': ["interests", "hobbies", "activities", "الهوايات", "الاهتمامات"],
+    'references': ["references", "المراجع", "المعرفون"],
+}
+_HEADING_LOOKUP = {kw: section for section, kws in SECTION_HEADINGS.items() for kw in kws}
+
+_PAGE_NUMBER_RE = re.compile(r"^(?:page|صفحة)?\s*[-–]?\s*\d{1,3}\s*(?:(?:/|of|من)\s*\d{1,3})?\s*[-–]?$", re.IGNORECASE)
+_BOILERPLATE_RE = re.compile(
+    r"^(?:curriculum vitae|resume|résumé|cv|السيرة الذاتية"
+    r"|references (?:are )?available (?:up)?on request)\.?$",
+    re.IGNORECASE,
+)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_URL_RE = re.compile(r"(?:https?://|www\.)\S+|(?:linkedin|github)\.com/\S*", re.IGNORECASE)
+_PHONE_RE = re.compile(r"\+?\(?\d[\d\s().-]{7,}\d")
+# Runs of years ("2015 - 2019") look like phone numbers to _PHONE_RE
+_YEARS_RE = re.compile(r"^(?:(?:19|20)\d{2}[\s().-]*)+$")
+PHONE_MIN_DIGITS = 9
+_CONTACT_LABEL_RE = re.compile(
+    r"^(?:phone|mobile|tel|email|e-mail|address|linkedin|github|website|الهاتف|الجوال|البريد|العنوان)\b",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for Llama-family tokenizers: ~4 characters per token for
+    Latin-script words, ~2 for other scripts (Arabic), one per punctuation mark.
+    """
+    tokens = 0
+    for piece in _WORD_RE.findall(text):
+        per_token = 4 if piece.isascii() else 2
+        tokens += math.ceil(len(piece) / per_token)
+    return tokens
+
+
+def normalize_whitespace(text: str) -> List[str]:
+    """Non-empty lines with runs of spaces/tabs collapsed."""
+    return [line for line in (" ".join(raw.split()) for raw in text.splitlines()) if line]
+
+
+def _strip_phone(match) -> str:
+    number = match.group(0)
+    if sum(ch.isdigit() for ch in number) < PHONE_MIN_DIGITS or _YEARS_RE.match(number.strip()):
+        return number
+    return ""
+
+
+def _is_contact_line(line: str) -> bool:
+    if _CONTACT_LABEL_RE.match(line):
+        return True
+    # Lines made up mostly of emails, URLs and phone numbers
+    residue = _PHONE_RE.sub(_strip_phone, _URL_RE.sub("", _EMAIL_RE.sub("", line)))
+    return len(residue.strip(" |,;•·-")) < len(line) * 0.4
+
+
+def page_headers(pages: List[List[str]]) -> Set[str]:
+    """
+    Short lines found at the top or bottom of REPEATED_LINE_MIN or more pages.
+    A line repeated in the body (a job title held at several employers) doesn't count.
+    """
+    counts = Counter()
+    for lines in pages:
+        edges = set(lines[:EDGE_LINES]) | set(lines[-EDGE_LINES:])
+        counts.update(line for line in edges if len(line) <= HEADER_MAX_CHARS)
+    return {line for line, n in counts.items() if n >= REPEATED_LINE_MIN}
+
+
+def strip_boilerplate(lines: List[str], keep_contact: bool = False, headers: Set[str] = frozenset()) -> List[str]:
+    """Drop page numbers, page `headers`/footers, title boilerplate and contact lines."""
+    kept = []
+    for line in lines:
+        if _PAGE_NUMBER_RE.match(line) or _BOILERPLATE_RE.match(line):
+            continue
+        if line in headers:
+            continue
+        if not keep_contact and _is_contact_line(line):
+            continue
+        kept.append(line)
+    return kept
+
+
+def _heading_section(line: str):
+    key = line.strip(" :：-–•*#").lower()
+    if len(key) > 40:
+        return None
+    return _HEADING_LOOKUP.get(key)
+
+
+def _fit_words(line: str, max_tokens: int) -> str:
+    """Longest word prefix of `line` within `max_tokens`, or '' if that's under a few words."""
+    words, spent = [], 0
+    for word in line.split():
+        cost = estimate_tokens(word)
+        if spent + cost > max_tokens:
+            break
+        words.append(word)
+        spent += cost
+    return " ".join(words) if len(words) >= 5 else ""
+
+
+def split_sections(lines: List[str]) -> List[Tuple[str, List[str]]]:
+    """[(section name, lines)] in document order; the heading line stays with its section."""
+    sections = [('header', [])]
+    for line in lines:
+        section = _heading_section(line)
+        if section:
+            sections.append((section, [line]))
+        else:
+            sections[-1][1].append(line)
+    return [(name, body) for name, body in sections if body]
+
+
+def compact_cv_text(text: str, max_tokens: int = CV_PROMPT_TOKENS, keep_contact: bool = False,
+                    priority: Optional[List[str]] = None) -> str:
+    """
+    Compact CV text to at most `max_tokens` (estimated).
+    Sections are taken whole in `priority` order (SECTION_PRIORITY, or CONTACT_SECTION_PRIORITY
+    with keep_contact); the section that crosses the budget is cut at a line (or, for a very
+    long line, word) boundary. Kept sections stay in document order.
+    """
+    if priority is None:
+        priority = CONTACT_SECTION_PRIORITY if keep_contact else SECTION_PRIORITY
+    pages = [normalize_whitespace(page) for page in text.split(PAGE_BREAK)]
+    headers = page_headers(pages) if len(pages) > 1 else set()
+    lines = strip_boilerplate([line for page in pages for line in page], keep_contact=keep_contact, headers=headers)
+    sections = split_sections(lines)
+
+    rank = {name: n for n, name in enumerate(priority)}
+    # Sections missing from `priority` go last
+    order = sorted(range(len(sections)), key=lambda i: rank.get(sections[i][0], len(rank)))
+    selected = {}
+    remaining = max_tokens
+    for i in order:
+        kept, spent = [], 0
+        for line in sections[i][1]:
+            cost = estimate_tokens(line) + 1
+            if spent + cost > remaining:
+                # Extraction can yield whole paragraphs as one line; keep the words that fit
+                partial = _fit_words(line, remaining - spent - 1)
+                if partial:
+                    kept.append(partial)
+                    spent = remaining
+                break
+            kept.append(line)
+            spent += cost
+        # A heading on its own is not worth its tokens
+        if len(kept) > 1 or (kept and len(sections[i][1]) == 1):
+            selected[i] = kept
+            remaining -= spent
+        if remaining <= 0:
+            break
+
+    return "\n".join(line for i in sorted(selected) for line in selected[i])
@@ -0,0 +1,144 @@
+"""
+Hedged LLM requests for tail-latency control
+When a call to a hedged task is still running after the task's usual latency
+(the rolling p90 for its model), an identical second request is sent; the
+first good answer wins and the other request is cancelled. A token bucket
+shared by every worker keeps hedges to a small share of all requests so the
+token bill doesn't double when Groq is slow across the board
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .model_routing import get_router
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_TASKS = {t.strip() for t in os.getenv("LLM_HEDGE_TASKS", "quiz,quiz_topup").split(",") if t.strip()}
+# Hedge after this percentile of the model's recent latency for the task...
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+# ...or after this many seconds while there are too few samples
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+# In the long run at most this share of requests get a hedge...
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.05"))
+# ...with up to this many hedges allowed before any requests have earned them
+LLM_HEDGE_BURST = float(os.getenv("LLM_HEDGE_BURST", "2"))
+# File holding the bucket, so the cap holds across gunicorn workers; empty keeps one bucket per worker
+LLM_HEDGE_BUDGET_PATH = os.getenv("LLM_HEDGE_BUDGET_PATH",
+                                  str(Path(__file__).resolve().parent.parent / "hedge_budget.json"))
+
+_budget: Optional["HedgeBudget"] = None
+_budget_lock = threading.Lock()
+
+
+class HedgeBudget:
+    """
+    Token bucket for hedges: each request adds `max_rate` of a token, each hedge takes
+    one, and the bucket holds at most `burst` tokens. It starts full, so the first slow
+    calls can be hedged while hedges stay near `max_rate` of requests over time.
+    With a `path` the bucket lives in that file under an exclusive lock and is shared
+    by every worker; if the file can't be used, each worker falls back to its own bucket.
+    """
+
+    def __init__(self, max_rate: float = LLM_HEDGE_MAX_RATE, burst: float = LLM_HEDGE_BURST,
+                 path: Optional[str] = LLM_HEDGE_BUDGET_PATH):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.path = path or None
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def _update(self, change: Callable[[float], Tuple[float, bool]]) -> bool:
+        """Apply change(tokens) -> (tokens, result) to the bucket and return the result."""
+        with self._lock:
+            if self.path:
+                try:
+                    with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), "r+") as fh:
+                        fcntl.flock(fh, fcntl.LOCK_EX)
+                        try:
+                            tokens = float(json.loads(fh.read())['tokens'])
+                        except (ValueError, KeyError, TypeError):
+                            tokens = self.burst
+                        tokens, result = change(tokens)
+                        fh.seek(0)
+                        fh.truncate()
+                        json.dump({'tokens': tokens}, fh)
+                        return result
+                except OSError as e:
+                    logger.warning(f"Hedge budget file {self.path} unusable ({e}); using a per-worker budget")
+                    self.path = None
+            self._tokens, result = change(self._tokens)
+            return result
+
+    def note_request(self) -> None:
+        self._update(lambda tokens: (min(self.burst, tokens + self.max_rate), True))
+
+    def try_acquire(self) -> bool:
+        return self._update(lambda tokens: (tokens - 1, True) if tokens >= 1 else (tokens, False))
+
+
+def get_hedge_budget() -> HedgeBudget:
+    global _budget
+
+    with _budget_lock:
+        if _budget is None:
+            _budget = HedgeBudget()
+    return _budget
+
+
+def hedge_delay(task: Optional[str], model: str) -> Optional[float]:
+    """Seconds to wait before hedging a call, or None if the call is not hedged."""
+    if not LLM_HEDGING or task not in LLM_HEDGE_TASKS:
+        return None
+    p = get_router().tracker.percentile(task, model, LLM_HEDGE_PERCENTILE)
+    return p / 1000 if p is not None else LLM_HEDGE_DELAY
+
+
+async def hedged(call: Callable[[float], Awaitable[str]], task: Optional[str], model: str, timeout: float) -> str:
+    """
+    Run call(timeout), hedging it with a second call(remaining budget) if it is
+    slow and the budget allows. Returns the first successful result; raises the
+    first error only if every request failed.
+    """
+    delay = hedge_delay(task, model)
+    if delay is None:
+        return await call(timeout)
+
+    budget = get_hedge_budget()
+    budget.note_request()
+    started = time.monotonic()
+    primary = asyncio.ensure_future(call(timeout))
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    remaining = timeout - (time.monotonic() - started)
+    # Not worth a second request that would have almost no budget left
+    if done or remaining < timeout / 4 or not budget.try_acquire():
+        return await primary
+
+    logger.info(f"LLM {task} ({model}) still running after {delay:.1f}s; sending a hedged request")
+    hedge = asyncio.ensure_future(call(remaining))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task_done in done:
+                if task_done.exception() is None:
+                    if task_done is hedge:
+                        logger.info(f"LLM {task}: hedged request won")
+                    return task_done.result()
+                error = error or task_done.exception()
+        raise error
+    finally:
+        for request in pending:
+            request.cancel()
@@ -0,0 +1,145 @@
+"""
+Incremental parser for JSON arrays arriving in chunks
+Feeds on LLM output as it streams and hands back each top-level item of the
+first array as soon as it is complete, ignoring any prose or markdown fences
+around the array
+"""
+import json
+import logging
+import re
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+class JSONArrayStream:
+    """
+    Bracket-aware scanner: tracks nesting depth and string/escape state, so braces
+    inside string values don't end an object early.
+    Items of `item_type` (objects by default, or strings) are kept; `validate`, if
+    given, maps each item to its accepted form or None to drop it. Every dropped
+    item is recorded in `dropped` as {'index', 'reason'}.
+    """
+
+    def __init__(self, item_type=dict, validate: Optional[Callable] = None):
+        self.item_type = item_type
+        self.validate = validate
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.finished = False
+        # Non-item text inside the current brackets, e.g. the "1" of a prose "[1]"
+        self._bare = False
+        self._capturing = False
+        self._current: List[str] = []
+        self.index = 0
+        self.dropped: List[dict] = []
+
+    @property
+    def skipped(self) -> int:
+        return len(self.dropped)
+
+    def feed(self, chunk: str) -> list:
+        """Consume a chunk and return the items it completed."""
+        completed = []
+        for ch in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self._capturing:
+                self._current.append(ch)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self._emit(completed)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self._start(ch)
+            elif ch in "[{":
+                self.depth += 1
+                if self.depth == 2:
+                    self._start(ch)
+            elif ch in "]}":
+                self.depth -= 1
+                if self.depth == 1:
+                    self._emit(completed)
+                elif self.depth == 0 and self.index == 0 and self._bare:
+                    # Brackets in prose before the array; keep looking for it
+                    self.started = False
+                    self._bare = False
+                elif self.depth == 0:
+                    self.finished = True
+            elif self.depth == 1 and not ch.isspace() and ch != ",":
+                self._bare = True
+        return completed
+
+    def close(self) -> dict:
+        """
+        Call once the input has ended. Returns the report:
+        {'kept': n, 'dropped': [{'index', 'reason'}], 'truncated': bool}
+        """
+        truncated = self.started and not self.finished
+        if self._capturing:
+            self._drop("truncated")
+            self._capturing = False
+            self.index += 1
+        return {'kept': self.index - len(self.dropped), 'dropped': self.dropped, 'truncated': truncated}
+
+    def _start(self, ch: str) -> None:
+        self._capturing = True
+        self._current = [ch]
+
+    def _emit(self, completed: list) -> None:
+        item = self._parse("".join(self._current))
+        self._capturing = False
+        self._current = []
+        if item is not None:
+            completed.append(item)
+        self.index += 1
+
+    def _drop(self, reason: str) -> None:
+        logger.warning(f"Dropping array item {self.index}: {reason}")
+        self.dropped.append({'index': self.index, 'reason': reason})
+
+    def _parse(self, text: str):
+        try:
+            item = loads_lenient(text)
+        except json.JSONDecodeError as e:
+            self._drop(f"malformed JSON ({e.msg})")
+            return None
+        if not isinstance(item, self.item_type):
+            self._drop(f"not a {self.item_type.__name__}")
+            return None
+        if self.validate is not None:
+            item = self.validate(item)
+            if item is None:
+                self._drop("failed validation")
+        return item
+
+
+def loads_lenient(text: str):
+    """json.loads that also accepts raw newlines in strings and trailing commas."""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        repaired = _TRAILING_COMMA_RE.sub(r"\1", text)
+        if repaired == text:
+            raise
+        return json.loads(repaired, strict=False)
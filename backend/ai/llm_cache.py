@@ -0,0 +1,136 @@
+"""
+Persistent cache of LLM responses shared by every worker
+Entries live in a SQLite file (WAL mode, so gunicorn workers read and write it
+concurrently), expire after a TTL and are evicted least-recently-used once the
+cache grows past its size limit
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(Path(__file__).resolve().parent.parent / "llm_cache.sqlite3"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Evict at most once per this many writes; the size limit is a soft bound
+_EVICT_EVERY = 50
+
+_cache: Optional["LLMCache"] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def cache_key(model: str, task: str, prompt_version: int, params: dict, prompt: str) -> str:
+    """Hash of everything that determines a completion."""
+    material = json.dumps(
+        {'model': model, 'task': task, 'version': prompt_version, 'params': params, 'prompt': prompt},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """TTL + LRU key/value store on a SQLite file. Errors are logged and treated as misses."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._restrict_permissions()
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def _restrict_permissions(self) -> None:
+        """
+        Completions hold personal data (extracted names, phone numbers, cities), so the file
+        is private to the app's user; SQLite gives its -wal and -shm files the same mode.
+        """
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        for path in (self.path, self.path + "-wal", self.path + "-shm"):
+            try:
+                os.chmod(path, 0o600)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 1:
+                self.evict()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones beyond max_entries."""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if removed:
+            logger.info(f"LLM cache evicted {removed} entries")
+        return removed
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Get or create the process-wide LLM cache, or None when LLM_CACHE_ENABLED is off."""
+    global _cache, _cache_pid
+
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        # SQLite connections must not cross a fork
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = LLMCache()
+            _cache_pid = os.getpid()
+    return _cache
@@ -0,0 +1,489 @@
+"""
+Groq chat-completions clients shared by every ai_logic LLM call
+One keep-alive connection pool per process (per event loop for the async
+client), bounded retries with jittered backoff on 429/5xx (honoring
+Retry-After), a time budget per call, a shared response cache (with
+single-flight coalescing of identical calls) for calls that name their task,
+per-task model routing with latency tracking, optional hedging of slow async
+calls and per-task token accounting
+"""
+import os
+import asyncio
+import json
+import random
+import weakref
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .compaction import estimate_tokens
+from .hedging import hedged
+from .llm_cache import cache_key, get_llm_cache
+from .model_routing import get_router
+from .singleflight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: Optional["GroqClient"] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGroqClient]" = weakref.WeakKeyDictionary()
+
+_usage: dict = {}
+_usage_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """A chat completion that failed or ran out of time budget."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def record_usage(task: Optional[str], model: str, estimated: int, usage: Optional[dict], cached: bool = False) -> None:
+    """
+    Log the token counts of one call and add them to this process's per-task totals.
+    `estimated` is our count of the prompt; `usage` is what Groq billed (absent for cache hits).
+    """
+    usage = usage or {}
+    task = task or "untagged"
+    if cached:
+        logger.info(f"LLM {task} ({model}): cache hit, ~{estimated} prompt tokens saved")
+    else:
+        logger.info(
+            f"LLM {task} ({model}): ~{estimated} prompt tokens estimated, "
+            f"{usage.get('prompt_tokens', '?')} prompt + {usage.get('completion_tokens', '?')} completion billed"
+        )
+    with _usage_lock:
+        totals = _usage.setdefault(task, {
+            'calls': 0, 'cache_hits': 0, 'estimated_prompt_tokens': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        })
+        totals['calls'] += 1
+        totals['cache_hits'] += int(cached)
+        totals['estimated_prompt_tokens'] += estimated
+        totals['prompt_tokens'] += usage.get('prompt_tokens') or 0
+        totals['completion_tokens'] += usage.get('completion_tokens') or 0
+
+
+def token_usage() -> dict:
+    """Per-task token totals recorded by this process."""
+    with _usage_lock:
+        return {task: dict(totals) for task, totals in _usage.items()}
+
+
+class _RetryingClient:
+    """Request payload and retry policy shared by the sync and async clients."""
+
+    def __init__(self, api_key: Optional[str], max_retries: int = LLM_MAX_RETRIES,
+                 pool_size: int = LLM_POOL_SIZE, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _payload(self, prompt: str, temperature: float, max_tokens: int, top_p: float, model: str) -> dict:
+        return {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+        }
+
+    def _cache_key(self, payload: dict, task: Optional[str], prompt_version: int) -> Optional[str]:
+        """Cache key for a call, or None when the call is not cacheable."""
+        if not task:
+            return None
+        params = {k: v for k, v in payload.items() if k not in ("model", "messages")}
+        return cache_key(payload["model"], task, prompt_version, params, payload["messages"][0]["content"])
+
+    def _completion(self, data: dict, cache, key: Optional[str], task: Optional[str], estimated: int) -> str:
+        """Completion text from a 200 response; stores it unless the output was cut off."""
+        choice = data["choices"][0]
+        content = choice["message"]["content"]
+        record_usage(task, data.get("model", "?"), estimated, data.get("usage"))
+        self._store(cache, key, content, choice.get("finish_reason"))
+        return content
+
+    def _store(self, cache, key: Optional[str], content: str, finish_reason: Optional[str]) -> None:
+        if cache and key and finish_reason in ("stop", None):
+            cache.set(key, content)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _response_error(self, status_code: int, body: str, retry_after: Optional[str]):
+        """LLMError for a non-200 response, raised at once unless the status is retryable."""
+        error = LLMError(f"Groq API Error ({status_code})", status_code, body)
+        if status_code not in RETRY_STATUSES:
+            raise error
+        return error, _retry_after_seconds(retry_after)
+
+    def _record_latency(self, task: Optional[str], model: str, started: float, ok: bool = True) -> None:
+        get_router().record(task, model, (time.monotonic() - started) * 1000, ok=ok)
+
+    def _models(self, task: Optional[str], model: Optional[str]) -> list:
+        """The explicit model, or the task's route in order of preference."""
+        return [model] if model else get_router().candidates(task)
+
+    def _fail_over(self, error: LLMError, models: list, index: int, started: float, timeout: float,
+                   task: Optional[str]) -> bool:
+        """Whether a failed call moves on to the next routed model (only while a third of the budget is left)."""
+        remaining = timeout - (time.monotonic() - started)
+        if index + 1 >= len(models) or remaining < timeout / 3:
+            return False
+        logger.warning(f"LLM {task} on {models[index]} failed ({error}); falling back to {models[index + 1]}")
+        return True
+
+    def _retry_delay(self, attempt: int, error: LLMError, retry_after: Optional[float], deadline: float) -> float:
+        """Seconds to wait before the next attempt; re-raises when retries or budget are spent."""
+        if attempt >= self.max_retries:
+            raise error
+        delay = retry_after if retry_after is not None else self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            raise error
+        logger.warning(f"{error}; retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+
+class GroqClient(_RetryingClient):
+    """Pooled, retrying client for Groq's OpenAI-compatible chat completions API."""
+
+    def __init__(self, api_key: Optional[str], **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+        self.session.headers.update(self.headers)
+
+    def chat(self, prompt: str, *, temperature: float, max_tokens: int, top_p: float = 0.9,
+             model: Optional[str] = None, timeout: float = 30, task: Optional[str] = None,
+             prompt_version: int = 1, fresh: bool = False) -> str:
+        """
+        Send a single user prompt and return the completion text.
+        `timeout` is the budget for the whole call, retries and backoff included.
+        Without a `model` the task's route picks one (see model_routing); if it fails
+        early in the budget, the next model in the route gets the rest.
+        Calls that name their `task` go through the response cache; bump `prompt_version`
+        when the task's prompt template changes, and pass `fresh=True` to skip the lookup
+        (the new completion still replaces the cached one).
+        Raises LLMError on a non-retryable error or once retries or budget run out.
+        """
+        models = self._models(task, model)
+        started = time.monotonic()
+        for index, candidate in enumerate(models):
+            try:
+                return self._chat(prompt, temperature, max_tokens, top_p, candidate,
+                                  timeout - (time.monotonic() - started), task, prompt_version, fresh)
+            except LLMError as e:
+                if not self._fail_over(e, models, index, started, timeout, task):
+                    raise
+
+    def _chat(self, prompt: str, temperature: float, max_tokens: int, top_p: float, model: str,
+              timeout: float, task: Optional[str], prompt_version: int, fresh: bool) -> str:
+        payload = self._payload(prompt, temperature, max_tokens, top_p, model)
+        estimated = estimate_tokens(prompt)
+        key = self._cache_key(payload, task, prompt_version)
+        cache = get_llm_cache() if key else None
+        if cache and not fresh:
+            cached = cache.get(key)
+            if cached is not None:
+                record_usage(task, model, estimated, None, cached=True)
+                return cached
+
+        if key and not fresh:
+            # Identical calls in flight in other threads or workers share one request
+            return get_single_flight().do(
+                ("llm", key), lambda: self._shared_request(payload, timeout, cache, key, task, estimated), wait=timeout)
+        return self._request(payload, timeout, cache, key, task, estimated)
+
+    def _shared_request(self, payload: dict, timeout: float, cache, key: str,
+                        task: Optional[str], estimated: int) -> str:
+        """
+        _request for a single-flight caller. A waiter that missed the leader's
+        result (it is only kept briefly) usually finds the completion in the cache.
+        """
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            record_usage(task, payload["model"], estimated, None, cached=True)
+            return cached
+        return self._request(payload, timeout, cache, key, task, estimated)
+
+    def _request(self, payload: dict, timeout: float, cache, key: Optional[str],
+                 task: Optional[str], estimated: int) -> str:
+        started = time.monotonic()
+        try:
+            content = self._attempts(payload, timeout, cache, key, task, estimated)
+        except LLMError:
+            self._record_latency(task, payload["model"], started, ok=False)
+            raise
+        self._record_latency(task, payload["model"], started)
+        return content
+
+    def _attempts(self, payload: dict, timeout: float, cache, key: Optional[str],
+                  task: Optional[str], estimated: int) -> str:
+        deadline = time.monotonic() + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"Groq call exceeded its {timeout}s budget")
+
+            retry_after = None
+            try:
+                response = self.session.post(GROQ_API_URL, json=payload, timeout=remaining)
+            except requests.RequestException as e:
+                error = LLMError(f"Groq request failed: {e}")
+            else:
+                if response.status_code == 200:
+                    return self._completion(response.json(), cache, key, task, estimated)
+                error, retry_after = self._response_error(
+                    response.status_code, response.text, response.headers.get("Retry-After"))
+
+            time.sleep(self._retry_delay(attempt, error, retry_after, deadline))
+            attempt += 1
+
+
+class AsyncGroqClient(_RetryingClient):
+    """
+    asyncio counterpart of GroqClient, so one process can hold many in-flight calls.
+    httpx connections belong to the event loop that opened them; use get_async_llm_client().
+    """
+
+    def __init__(self, api_key: Optional[str], **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def chat(self, prompt: str, *, temperature: float, max_tokens: int, top_p: float = 0.9,
+                   model: Optional[str] = None, timeout: float = 30, task: Optional[str] = None,
+                   prompt_version: int = 1, fresh: bool = False) -> str:
+        """Async version of GroqClient.chat with the same budget, routing, retry and cache rules."""
+        models = self._models(task, model)
+        started = time.monotonic()
+        for index, candidate in enumerate(models):
+            try:
+                return await self._chat(prompt, temperature, max_tokens, top_p, candidate,
+                                        timeout - (time.monotonic() - started), task, prompt_version, fresh)
+            except LLMError as e:
+                if not self._fail_over(e, models, index, started, timeout, task):
+                    raise
+
+    async def _chat(self, prompt: str, temperature: float, max_tokens: int, top_p: float, model: str,
+                    timeout: float, task: Optional[str], prompt_version: int, fresh: bool) -> str:
+        payload = self._payload(prompt, temperature, max_tokens, top_p, model)
+        estimated = estimate_tokens(prompt)
+        key = self._cache_key(payload, task, prompt_version)
+        cache = get_llm_cache() if key else None
+        if cache and not fresh:
+            # SQLite is blocking; keep it off the event loop
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                record_usage(task, model, estimated, None, cached=True)
+                return cached
+
+        if key and not fresh:
+            # Identical calls in flight in other tasks or workers share one request
+            return await get_single_flight().ado(
+                ("llm", key), lambda: self._shared_request(payload, timeout, cache, key, task, estimated),
+                wait=timeout)
+        return await self._request(payload, timeout, cache, key, task, estimated)
+
+    async def _shared_request(self, payload: dict, timeout: float, cache, key: str,
+                              task: Optional[str], estimated: int) -> str:
+        """Async version of GroqClient._shared_request."""
+        cached = await asyncio.to_thread(cache.get, key) if cache else None
+        if cached is not None:
+            record_usage(task, payload["model"], estimated, None, cached=True)
+            return cached
+        return await self._request(payload, timeout, cache, key, task, estimated)
+
+    async def _request(self, payload: dict, timeout: float, cache, key: Optional[str],
+                       task: Optional[str], estimated: int) -> str:
+        started = time.monotonic()
+        try:
+            # A slow call to a hedged task may get a duplicate request; the first answer wins
+            content = await hedged(
+                lambda budget: self._attempts(payload, budget, cache, key, task, estimated),
+                task, payload["model"], timeout)
+        except LLMError:
+            self._record_latency(task, payload["model"], started, ok=False)
+            raise
+        self._record_latency(task, payload["model"], started)
+        return content
+
+    async def _attempts(self, payload: dict, timeout: float, cache, key: Optional[str],
+                        task: Optional[str], estimated: int) -> str:
+        deadline = time.monotonic() + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"Groq call exceeded its {timeout}s budget")
+
+            retry_after = None
+            try:
+                response = await self.client.post(GROQ_API_URL, json=payload, timeout=remaining)
+            except httpx.HTTPError as e:
+                error = LLMError(f"Groq request failed: {e}")
+            else:
+                if response.status_code == 200:
+                    return await asyncio.to_thread(
+                        self._completion, response.json(), cache, key, task, estimated)
+                error, retry_after = self._response_error(
+                    response.status_code, response.text, response.headers.get("Retry-After"))
+
+            await asyncio.sleep(self._retry_delay(attempt, error, retry_after, deadline))
+            attempt += 1
+
+    async def stream_chat(self, prompt: str, *, temperature: float, max_tokens: int, top_p: float = 0.9,
+                          model: Optional[str] = None, timeout: float = 30, task: Optional[str] = None,
+                          prompt_version: int = 1, fresh: bool = False) -> AsyncIterator[str]:
+        """
+        Yield completion text as Groq streams it (a cached completion comes back as one chunk).
+        The model is the best one on the task's route; there is no fallback mid-stream.
+        Retries only happen before the first chunk; a failure after that raises LLMError.
+        """
+        model = self._models(task, model)[0]
+        payload = self._payload(prompt, temperature, max_tokens, top_p, model)
+        estimated = estimate_tokens(prompt)
+        key = self._cache_key(payload, task, prompt_version)
+        cache = get_llm_cache() if key else None
+        if cache and not fresh:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                record_usage(task, model, estimated, None, cached=True)
+                yield cached
+                return
+
+        payload["stream"] = True
+        started = time.monotonic()
+        deadline = started + timeout
+        attempt = 0
+        parts = []
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record_latency(task, model, started, ok=False)
+                raise LLMError(f"Groq call exceeded its {timeout}s budget")
+
+            retry_after = None
+            try:
+                async with self.client.stream("POST", GROQ_API_URL, json=payload, timeout=remaining) as response:
+                    if response.status_code == 200:
+                        finish_reason, usage = None, None
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            if not data:
+                                continue
+                            try:
+                                event = json.loads(data)
+                            except ValueError:
+                                self._record_latency(task, model, started, ok=False)
+                                raise LLMError("Groq stream sent malformed data", body=data[:500])
+                            usage = event.get("usage") or (event.get("x_groq") or {}).get("usage") or usage
+                            if not event.get("choices"):
+                                continue
+                            choice = event["choices"][0]
+                            finish_reason = choice.get("finish_reason") or finish_reason
+                            text = (choice.get("delta") or {}).get("content")
+                            if text:
+                                parts.append(text)
+                                yield text
+                            if time.monotonic() > deadline:
+                                self._record_latency(task, model, started, ok=False)
+                                raise LLMError(f"Groq stream exceeded its {timeout}s budget")
+                        record_usage(task, model, estimated, usage)
+                        self._record_latency(task, model, started)
+                        await asyncio.to_thread(self._store, cache, key, "".join(parts), finish_reason)
+                        return
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    error, retry_after = self._response_error(
+                        response.status_code, body, response.headers.get("Retry-After"))
+            except httpx.HTTPError as e:
+                if parts:
+                    self._record_latency(task, model, started, ok=False)
+                    raise LLMError(f"Groq stream interrupted: {e}")
+                error = LLMError(f"Groq request failed: {e}")
+
+            try:
+                delay = self._retry_delay(attempt, error, retry_after, deadline)
+            except LLMError:
+                self._record_latency(task, model, started, ok=False)
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def get_llm_client() -> GroqClient:
+    """
+    Get or create the process-wide Groq client.
+    Connection pools must not be shared across a fork, so each worker builds its own.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                logger.warning("GROQ_API_KEY is not set; LLM calls will fail")
+            _client = GroqClient(api_key)
+            _client_pid = os.getpid()
+            logger.info("Groq client initialized")
+    return _client
+
+
+def get_async_llm_client() -> AsyncGroqClient:
+    """
+    Get or create the async Groq client for the running event loop.
+    Under ASGI there is one loop per process; async views served over WSGI get a
+    fresh loop per request, and each gets its own client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncGroqClient(os.getenv("GROQ_API_KEY"))
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,154 @@
+"""
+Salvaging parsers and schemas for JSON the LLM returns
+One bracket-aware pass over the completion recovers every complete item, so a
+reply cut off by max_tokens or with one malformed entry still yields the rest.
+Items are checked against their schema, and what was dropped (and why) is
+reported instead of the whole reply being discarded
+"""
+import json
+import logging
+import re
+from typing import Callable, Optional, Tuple
+
+from .json_stream import JSONArrayStream, loads_lenient
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ['easy', 'intermediate', 'advanced']
+_LETTERS = "abcd"
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_question(raw) -> Optional[dict]:
+    """
+    A generated question in canonical form, or None if it is unusable.
+    Needs a question, 4 distinct options and an answer that resolves to one of them
+    (the option text, its index or its letter). Adds 'correctAnswer' (the index).
+    """
+    if not isinstance(raw, dict):
+        return None
+    question = str(raw.get('question') or "").strip()
+    options = raw.get('options')
+    if not question or not isinstance(options, list) or len(options) != 4:
+        return None
+    options = [str(o).strip() for o in options]
+    if not all(options) or len({o.lower() for o in options}) != 4:
+        return None
+
+    answer = raw.get('answer', raw.get('correctAnswer'))
+    index = None
+    if isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < 4:
+        index = answer
+    elif isinstance(answer, str):
+        text = answer.strip()
+        lowered = [o.lower() for o in options]
+        if text.lower() in lowered:
+            index = lowered.index(text.lower())
+        elif len(text) <= 2 and text[:1].lower() in _LETTERS and text[1:] in ("", ")", "."):
+            index = _LETTERS.index(text[0].lower())
+        elif text.isdigit() and int(text) < 4:
+            index = int(text)
+    if index is None:
+        return None
+
+    difficulty = str(raw.get('difficulty') or "").strip().lower()
+    return {
+        'question': question,
+        'options': options,
+        'answer': options[index],
+        'correctAnswer': index,
+        'difficulty': difficulty if difficulty in DIFFICULTIES else None,
+        'skill': str(raw.get('skill') or "").strip()[:255],
+    }
+
+
+def question_stem(question: str) -> str:
+    """A question's words, lowercased: equal for rewordings that only differ in case or punctuation."""
+    return " ".join(_WORD_RE.findall(question.lower()))
+
+
+def normalize_text_item(raw) -> Optional[str]:
+    """A non-empty string item (e.g. an interview question), stripped."""
+    text = raw.strip() if isinstance(raw, str) else ""
+    return text or None
+
+
+def parse_array(content: str, item_type=dict, validate: Optional[Callable] = None) -> Tuple[list, dict]:
+    """
+    Every complete, valid item of the first JSON array in `content`, and the report
+    {'kept', 'dropped': [{'index', 'reason'}], 'truncated'}.
+    """
+    parser = JSONArrayStream(item_type=item_type, validate=validate)
+    items = parser.feed(content or "")
+    report = parser.close()
+    if not parser.started:
+        report['dropped'].append({'index': None, 'reason': "no JSON array in output"})
+    if report['dropped'] or report['truncated']:
+        logger.warning(f"Salvaged {report['kept']} items from LLM output: {describe(report)}")
+    return items, report
+
+
+def parse_object(content: str) -> Tuple[Optional[dict], dict]:
+    """
+    The first JSON object in `content`. If it is cut off or malformed, the longest
+    run of leading members that parses is kept. Returns (object or None, report).
+    """
+    content = content or ""
+    start = content.find("{")
+    report = {'truncated': False, 'salvaged': False}
+    if start < 0:
+        return None, report
+
+    depth, in_string, escaped = 0, False, False
+    end, member_ends = None, []
+    for i in range(start, len(content)):
+        ch = content[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+            if depth == 0:
+                end = i + 1
+                break
+        elif ch == "," and depth == 1:
+            member_ends.append(i)
+
+    if end is not None:
+        try:
+            obj = loads_lenient(content[start:end])
+            if isinstance(obj, dict):
+                return obj, report
+        except json.JSONDecodeError:
+            pass
+    else:
+        report['truncated'] = True
+
+    for member_end in reversed(member_ends):
+        try:
+            obj = loads_lenient(content[start:member_end] + "}")
+        except json.JSONDecodeError:
+            continue
+        report['salvaged'] = True
+        logger.warning(f"Salvaged a partial JSON object from LLM output: kept {sorted(obj)}")
+        return obj, report
+    logger.warning("No usable JSON object in LLM output")
+    return None, report
+
+
+def describe(report: dict) -> str:
+    """One-line summary of a parse report for logs."""
+    parts = [f"item {d['index']}: {d['reason']}" if d['index'] is not None else d['reason']
+             for d in report.get('dropped', [])]
+    if report.get('truncated'):
+        parts.append("output truncated")
+    return "; ".join(parts) or "nothing dropped"
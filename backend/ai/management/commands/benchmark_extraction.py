@@ -0,0 +1,199 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from ai.bench_corpus import PAGE_SIZES, build_corpus
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _reset_peak_rss():
+    """Reset this process's peak RSS (VmHWM) to its current RSS. False where unsupported (non-Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_status_kb():
+    """(current RSS, peak RSS since the last reset) of this process in KB, from /proc/self/status."""
+    values = {}
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    values[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def _peak_rss_kb():
+    """Peak resident set size of this process and of its (OCR) children, in KB."""
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CV text extraction, language detection and fallback info parsing on a synthetic corpus'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per document and stage')
+        parser.add_argument('--seed', type=int, default=0, help='Corpus seed')
+        parser.add_argument('--pages', default=",".join(str(p) for p in PAGE_SIZES),
+                            help='Comma-separated page counts to generate')
+        parser.add_argument('--no-scanned', action='store_true', help='Skip scanned (OCR) documents')
+
+    def handle(self, *args, **options):
+        page_sizes = [int(p) for p in options['pages'].split(",") if p.strip()]
+        ocr_available = bool(shutil.which("pdftoppm") and shutil.which("tesseract"))
+        scanned = not options['no_scanned'] and ocr_available
+        repeat = max(1, options['repeat'])
+
+        self.stderr.write(f"Building corpus (seed={options['seed']}, pages={page_sizes})...")
+        corpus = build_corpus(seed=options['seed'], page_sizes=page_sizes, scanned=scanned)
+
+        # ai_logic prints while importing and extracting; keep stdout clean for the JSON report
+        devnull = open(os.devnull, "w")
+        with redirect_stdout(devnull):
+            from ai import ai_logic
+
+        stages = {
+            'extract_budgeted': lambda doc, text: ai_logic.extract_text(doc['data']),
+            'extract_full': lambda doc, text: ai_logic.extract_text(doc['data'], max_chars=None),
+            'detect_cv_language': lambda doc, text: ai_logic.detect_cv_language(text),
+            'extract_cv_info_fallback': lambda doc, text: ai_logic.extract_cv_info_fallback(text),
+        }
+        samples = {name: {} for name in stages}
+        # Resetting VmHWM also resets ru_maxrss, so the process peak is tracked across resets
+        process_peak = 0
+
+        # Warm up imports and caches so the first document doesn't carry them
+        with devnull, redirect_stdout(devnull):
+            ai_logic.extract_text(corpus[0]['data'])
+            ai_logic.detect_cv_language("warmup text")
+
+            for doc in corpus:
+                self.stderr.write(f"  {doc['name']}")
+                budgeted = ai_logic.extract_document(doc['data'])
+                text = budgeted['text']
+                # Throughput counts the pages a stage actually covers: the budgeted read
+                # (and the stages working on its text) stop early on long documents
+                pages_read = budgeted.get('pages_read', doc['pages'])
+                if 'pages_read' not in budgeted and budgeted['truncated']:
+                    # DOCX has no page boundaries to count; estimate from the share of the text read
+                    full = ai_logic.extract_text(doc['data'], max_chars=None)
+                    pages_read = doc['pages'] * len(text) / max(1, len(full))
+                for name, stage in stages.items():
+                    timings, peaks, growth = [], [], []
+                    for _ in range(repeat):
+                        process_peak = max(process_peak, _rss_status_kb()[1] or 0)
+                        reset = _reset_peak_rss()
+                        rss_before, _ = _rss_status_kb()
+                        started = time.perf_counter()
+                        stage(doc, text)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        _, peak = _rss_status_kb()
+                        if reset and peak is not None and rss_before is not None:
+                            peaks.append(peak)
+                            growth.append(peak - rss_before)
+                    samples[name].setdefault(doc['kind'], []).append({
+                        'doc': doc, 'pages': doc['pages'] if name == 'extract_full' else pages_read,
+                        'timings_ms': timings, 'peak_rss_kb': peaks, 'peak_rss_growth_kb': growth,
+                    })
+
+        # Read before spawning git, whose fork would count as a child the size of this process
+        peak_rss = _peak_rss_kb()
+        peak_rss['self'] = max(peak_rss['self'], process_peak, _rss_status_kb()[1] or 0)
+        report = {
+            'benchmark': 'extraction',
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'config': {
+                'seed': options['seed'],
+                'repeat': repeat,
+                'page_sizes': page_sizes,
+                'cv_text_budget': ai_logic.CV_TEXT_BUDGET,
+                'ocr_available': ocr_available,
+                'scanned_included': scanned,
+            },
+            'corpus': [
+                {'name': d['name'], 'kind': d['kind'], 'language': d['language'],
+                 'pages': d['pages'], 'bytes': len(d['data'])}
+                for d in corpus
+            ],
+            'stages': {name: self._summarize(by_kind) for name, by_kind in samples.items()},
+            'peak_rss_kb': peak_rss,
+        }
+
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], "w", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(payload)
+
+    def _summarize(self, by_kind):
+        """
+        Latency percentiles and throughput (over the pages each run actually read) per
+        document kind, plus the stage's peak RSS (VmHWM, reset before every run) and how far
+        it rose above the RSS at the start of the run. OCR children are not included.
+        """
+        summary = {}
+        for kind, runs in by_kind.items():
+            latencies = [t for run in runs for t in run['timings_ms']]
+            total_s = sum(latencies) / 1000
+            pages = sum(run['pages'] * len(run['timings_ms']) for run in runs)
+            mb = sum(len(run['doc']['data']) * len(run['timings_ms']) for run in runs) / (1024 * 1024)
+            summary[kind] = {
+                'runs': len(latencies),
+                'latency_ms': {
+                    'mean': round(sum(latencies) / len(latencies), 3),
+                    'p50': round(_percentile(latencies, 50), 3),
+                    'p90': round(_percentile(latencies, 90), 3),
+                    'p99': round(_percentile(latencies, 99), 3),
+                    'max': round(max(latencies), 3),
+                },
+                'throughput': {
+                    'docs_per_s': round(len(latencies) / total_s, 2) if total_s else None,
+                    'pages_per_s': round(pages / total_s, 2) if total_s else None,
+                    'mb_per_s': round(mb / total_s, 2) if total_s else None,
+                },
+                'peak_rss_kb': max((p for run in runs for p in run['peak_rss_kb']), default=None),
+                'peak_rss_growth_kb': max((g for run in runs for g in run['peak_rss_growth_kb']), default=None),
+            }
+        return summary
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractedText",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("text", models.TextField(blank=True)),
+                ("page_count", models.PositiveIntegerField(default=0)),
+                (
+                    "extraction_method",
+                    models.CharField(
+                        choices=[("text", "Text layer"), ("ocr", "OCR")],
+                        default="text",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "detected_language",
+                    models.CharField(
+                        choices=[("en", "English"), ("ar", "Arabic")],
+                        default="en",
+                        max_length=10,
+                    ),
+                ),
+                ("truncated", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
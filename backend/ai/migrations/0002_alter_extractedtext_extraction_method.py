@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="extractedtext",
+            name="extraction_method",
+            field=models.CharField(
+                choices=[
+                    ("text", "Text layer"),
+                    ("ocr", "OCR"),
+                    ("hybrid", "Text layer + OCR"),
+                ],
+                default="text",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0002_alter_extractedtext_extraction_method"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="extractedtext",
+            name="extraction_method",
+            field=models.CharField(
+                choices=[
+                    ("text", "Text layer"),
+                    ("ocr", "OCR"),
+                    ("hybrid", "Text layer + OCR"),
+                    ("docx", "DOCX"),
+                ],
+                default="text",
+                max_length=10,
+            ),
+        ),
+    ]
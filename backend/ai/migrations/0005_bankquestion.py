@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0004_pregeneratedquiz"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BankQuestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stem_hash", models.CharField(max_length=64, unique=True)),
+                ("question", models.TextField()),
+                ("options", models.JSONField(default=list)),
+                ("answer_index", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "difficulty",
+                    models.CharField(
+                        choices=[
+                            ("easy", "Easy"),
+                            ("intermediate", "Intermediate"),
+                            ("advanced", "Advanced"),
+                        ],
+                        default="intermediate",
+                        max_length=12,
+                    ),
+                ),
+                (
+                    "language",
+                    models.CharField(
+                        choices=[("en", "English"), ("ar", "Arabic")],
+                        default="en",
+                        max_length=10,
+                    ),
+                ),
+                ("skill", models.CharField(blank=True, db_index=True, max_length=255)),
+                ("job_titles", models.JSONField(blank=True, default=list)),
+                ("times_served", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["language", "difficulty"],
+                        name="ai_bankques_languag_6fc465_idx",
+                    )
+                ],
+            },
+        ),
+    ]
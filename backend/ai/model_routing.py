@@ -0,0 +1,179 @@
+"""
+Per-task model routing with latency-aware fallback
+Each LLM task has a primary model, fallbacks and a latency SLO. Every worker
+keeps the recent latencies of each (task, model) pair and sends a task to the
+first model in its list whose rolling p95 is within the SLO, so a primary
+that has slowed down is demoted until its slow samples age out of the window.
+Cheap tasks route to small, fast models first
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Latency samples older than this are forgotten, which is also how a demoted model gets another chance
+LLM_LATENCY_WINDOW = float(os.getenv("LLM_LATENCY_WINDOW", "600"))
+# A model with fewer samples than this in the window counts as within its SLO
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "5"))
+LLM_LATENCY_MAX_SAMPLES = 200
+
+MAVERICK = "meta-llama/llama-4-maverick-17b-128e-instruct"
+SCOUT = "meta-llama/llama-4-scout-17b-16e-instruct"
+VERSATILE = "llama-3.3-70b-versatile"
+INSTANT = "llama-3.1-8b-instant"
+# Model for calls without a route
+DEFAULT_MODEL = MAVERICK
+
+# task -> models in order of preference and the p95 latency (ms) the task should stay under.
+# Override or extend with LLM_ROUTES, e.g. '{"feedback": {"models": ["llama-3.1-8b-instant"], "slo_ms": 4000}}'
+ROUTES = {
+    'extract_info': {'models': [INSTANT, SCOUT], 'slo_ms': 3000},
+    'quiz': {'models': [MAVERICK, VERSATILE, SCOUT], 'slo_ms': 20000},
+    'quiz_topup': {'models': [MAVERICK, SCOUT], 'slo_ms': 8000},
+    'feedback': {'models': [SCOUT, INSTANT], 'slo_ms': 6000},
+    'interview_questions': {'models': [SCOUT, INSTANT], 'slo_ms': 5000},
+    'interview_eval': {'models': [MAVERICK, VERSATILE], 'slo_ms': 15000},
+}
+
+_router: Optional["ModelRouter"] = None
+_router_lock = threading.Lock()
+
+
+def _valid_route(route) -> bool:
+    models = route.get('models')
+    slo_ms = route.get('slo_ms')
+    return (isinstance(models, list) and bool(models) and all(isinstance(m, str) and m for m in models)
+            and isinstance(slo_ms, (int, float)) and not isinstance(slo_ms, bool) and slo_ms > 0)
+
+
+def _load_routes() -> dict:
+    routes = {task: dict(route) for task, route in ROUTES.items()}
+    override = os.getenv("LLM_ROUTES")
+    if override:
+        try:
+            for task, route in json.loads(override).items():
+                merged = {**routes.get(task, {'slo_ms': 30000}), **route} if isinstance(route, dict) else {}
+                # A route without models would leave the client nothing to call
+                if not _valid_route(merged):
+                    logger.error(f"Ignoring invalid LLM_ROUTES entry for {task}: {route}")
+                    continue
+                routes[task] = merged
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Ignoring invalid LLM_ROUTES: {e}")
+    return routes
+
+
+class LatencyTracker:
+    """Rolling per-(task, model) latency samples over a time window."""
+
+    def __init__(self, window: float = LLM_LATENCY_WINDOW, min_samples: int = LLM_LATENCY_MIN_SAMPLES,
+                 max_samples: int = LLM_LATENCY_MAX_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, task: str, model: str, latency_ms: float) -> None:
+        with self._lock:
+            self._samples[(task, model)].append((time.monotonic(), latency_ms))
+
+    def _recent(self, task: str, model: str) -> List[float]:
+        samples = self._samples.get((task, model))
+        if not samples:
+            return []
+        cutoff = time.monotonic() - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return sorted(ms for _, ms in samples)
+
+    def percentile(self, task: str, model: str, q: float) -> Optional[float]:
+        """The q-th percentile (0-1) of recent latencies in ms, or None with too few samples."""
+        with self._lock:
+            recent = self._recent(task, model)
+        if len(recent) < self.min_samples:
+            return None
+        return recent[min(len(recent) - 1, math.ceil(q * len(recent)) - 1)]
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        with self._lock:
+            keys = list(self._samples)
+        summary = defaultdict(dict)
+        for task, model in keys:
+            with self._lock:
+                count = len(self._recent(task, model))
+            summary[task][model] = {
+                'samples': count,
+                'p50_ms': self.percentile(task, model, 0.5),
+                'p95_ms': self.percentile(task, model, 0.95),
+            }
+        return dict(summary)
+
+
+class ModelRouter:
+    """Picks the model for each task from ROUTES and the observed latencies."""
+
+    def __init__(self, routes: Optional[dict] = None, default_model: str = DEFAULT_MODEL,
+                 tracker: Optional[LatencyTracker] = None):
+        self.routes = routes if routes is not None else _load_routes()
+        self.default_model = default_model
+        self.tracker = tracker or LatencyTracker()
+        self._chosen: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def slo_ms(self, task: Optional[str]) -> Optional[float]:
+        route = self.routes.get(task)
+        return route['slo_ms'] if route else None
+
+    def candidates(self, task: Optional[str]) -> List[str]:
+        """
+        Models to try for `task`, best first: those within the SLO (or without enough
+        samples) in configured order, then the rest by p95.
+        """
+        route = self.routes.get(task) if LLM_ROUTING_ENABLED else None
+        if not route:
+            return [self.default_model]
+        healthy, slow = [], []
+        for model in route['models']:
+            p95 = self.tracker.percentile(task, model, 0.95)
+            if p95 is None or p95 <= route['slo_ms']:
+                healthy.append(model)
+            else:
+                slow.append((p95, model))
+        ordered = healthy + [model for _, model in sorted(slow)]
+
+        with self._lock:
+            previous = self._chosen.get(task)
+            self._chosen[task] = ordered[0]
+        if previous != ordered[0]:
+            if ordered[0] != route['models'][0]:
+                logger.warning(f"LLM {task}: {route['models'][0]} over its {route['slo_ms']} ms p95 SLO; "
+                               f"routing to {ordered[0]}")
+            elif previous is not None:
+                logger.info(f"LLM {task}: back on {ordered[0]}")
+        return ordered
+
+    def record(self, task: Optional[str], model: str, latency_ms: float, ok: bool = True) -> None:
+        """Add a call's latency; a failed call counts as at least twice the SLO."""
+        if not task:
+            return
+        slo = self.slo_ms(task)
+        if not ok and slo:
+            latency_ms = max(latency_ms, slo * 2)
+        self.tracker.record(task, model, latency_ms)
+
+
+def get_router() -> ModelRouter:
+    """Get or create the process-wide router (latencies are tracked per worker)."""
+    global _router
+
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+    return _router
@@ -1,3 +1,61 @@
 from django.db import models
 
-# Create your models here.
+
+class ExtractedText(models.Model):
+    """Text extracted from a CV file, keyed by the SHA-256 of the file bytes."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    text = models.TextField(blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    extraction_method = models.CharField(max_length=10, default='text', choices=[('text', 'Text layer'), ('ocr', 'OCR'), ('hybrid', 'Text layer + OCR'), ('docx', 'DOCX')])
+    detected_language = models.CharField(max_length=10, default='en', choices=[('en', 'English'), ('ar', 'Arabic')])
+
+    # True when extraction stopped at the character budget rather than the end of the file
+    truncated = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.extraction_method}, {self.page_count} pages)"
+
+
+class PregeneratedQuiz(models.Model):
+    """A quiz generated in the background right after a CV upload."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('consumed', 'Consumed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    cv = models.OneToOneField('cv.CV', on_delete=models.CASCADE, related_name='pregenerated_quiz')
+    language = models.CharField(max_length=10, default='en', choices=[('en', 'English'), ('ar', 'Arabic')])
+    status = models.CharField(max_length=10, default='pending', choices=STATUS_CHOICES)
+    questions = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Pregenerated quiz for CV {self.cv_id} ({self.status})"
+
+
+class BankQuestion(models.Model):
+    """A validated quiz question kept for reuse, indexed by skill, job titles, difficulty and language."""
+    DIFFICULTY_CHOICES = [('easy', 'Easy'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')]
+
+    # SHA-256 of the language and the normalized question text, so a question is stored once
+    stem_hash = models.CharField(max_length=64, unique=True)
+    question = models.TextField()
+    options = models.JSONField(default=list)
+    answer_index = models.PositiveSmallIntegerField(default=0)
+    difficulty = models.CharField(max_length=12, default='intermediate', choices=DIFFICULTY_CHOICES)
+    language = models.CharField(max_length=10, default='en', choices=[('en', 'English'), ('ar', 'Arabic')])
+    skill = models.CharField(max_length=255, blank=True, db_index=True)
+    job_titles = models.JSONField(default=list, blank=True)
+    times_served = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['language', 'difficulty'])]
+
+    def __str__(self):
+        return f"[{self.language}/{self.difficulty}] {self.question[:50]}"
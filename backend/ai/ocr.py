@@ -0,0 +1,192 @@
+"""
+Multi-core OCR engine for scanned CVs
+Pages are rasterized and OCR'd in a bounded process pool so one scanned
+document uses the idle cores instead of a single gunicorn worker
+"""
+import os
+import math
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "20"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Ceiling for the page rasters of one document across all of its in-flight pages
+OCR_MAX_MEMORY_MB = int(os.getenv("OCR_MAX_MEMORY_MB", "256"))
+# Pool processes must not be forked from a worker that is already running threads
+# (event loop, sync_to_async, pipeline and pre-generation pools): a child can
+# inherit a lock held by another thread and deadlock
+OCR_START_METHOD = os.getenv("OCR_START_METHOD", "forkserver")
+
+# 8-bit grayscale raster plus the working copies tesseract makes while binarizing
+_BYTES_PER_PIXEL = 4
+_LETTER_AREA_IN2 = 8.5 * 11
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_pid: Optional[int] = None
+_pools_lock = threading.Lock()
+_engine: Optional["OCREngine"] = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get or create the shared process pool for the given size.
+    Pools never survive a fork, so they are recreated in each worker process.
+    """
+    global _pools_pid
+
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+
+        pool = _pools.get(workers)
+        if pool is None:
+            method = OCR_START_METHOD if OCR_START_METHOD in multiprocessing.get_all_start_methods() else "spawn"
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pools[workers] = pool
+            logger.info(f"OCR process pool started with {workers} workers")
+        return pool
+
+
+def _discard_pool(workers: int) -> None:
+    with _pools_lock:
+        pool = _pools.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ocr_page(pdf_path: str, page_number: int, dpi: int, lang: str, max_pixels: int) -> str:
+    """
+    Rasterize and OCR a single page in grayscale. Runs inside a pool process.
+    The raster is downscaled to max_pixels before OCR if the page renders larger than planned.
+    """
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    texts = []
+    for img in images:
+        if img.width * img.height > max_pixels:
+            scale = math.sqrt(max_pixels / (img.width * img.height))
+            resized = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+            img.close()
+            img = resized
+        texts.append(pytesseract.image_to_string(img, lang=lang))
+        img.close()
+    return "".join(texts)
+
+
+class OCREngine:
+    """
+    OCR a PDF page by page across a bounded process pool, keeping page order.
+    Pages are rendered one at a time (first_page/last_page) in grayscale, and the number
+    of pages in flight and each page's DPI are chosen so the rasters of one document
+    stay under max_memory_mb.
+    """
+
+    def __init__(self, dpi: int = OCR_DPI, workers: int = OCR_WORKERS,
+                 max_pages: int = OCR_MAX_PAGES, lang: str = OCR_LANG,
+                 max_memory_mb: int = OCR_MAX_MEMORY_MB):
+        self.dpi = dpi
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.lang = lang
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+
+        # Pages in flight: as many workers as can each hold a letter-size page at full DPI
+        letter_bytes = _LETTER_AREA_IN2 * dpi * dpi * _BYTES_PER_PIXEL
+        self.window = max(1, min(self.workers, int(self.max_memory_bytes // letter_bytes)))
+
+    def max_pixels(self) -> int:
+        """Pixel budget for one page raster."""
+        return int(self.max_memory_bytes / (self.window * _BYTES_PER_PIXEL))
+
+    def page_dpi(self, width_pt: float, height_pt: float) -> int:
+        """Configured DPI, lowered for pages too large to rasterize within the pixel budget."""
+        area_in2 = max(float(width_pt) / 72 * float(height_pt) / 72, 1e-6)
+        return max(1, min(self.dpi, int(math.sqrt(self.max_pixels() / area_in2))))
+
+    def page_numbers(self, pdf_path: str, page_count: Optional[int] = None) -> List[int]:
+        """1-based page numbers to OCR, capped at max_pages (0 disables the cap)."""
+        if page_count is None:
+            from PyPDF2 import PdfReader
+            page_count = len(PdfReader(pdf_path).pages)
+        if self.max_pages:
+            page_count = min(page_count, self.max_pages)
+        return list(range(1, page_count + 1))
+
+    def _page_jobs(self, pdf_path: str, pages: List[int], reader=None) -> List[tuple]:
+        """Arguments for _ocr_page, one tuple per page, with a per-page DPI."""
+        if reader is None:
+            from PyPDF2 import PdfReader
+            reader = PdfReader(pdf_path)
+        max_pixels = self.max_pixels()
+        jobs = []
+        for n in pages:
+            box = reader.pages[n - 1].mediabox
+            jobs.append((pdf_path, n, self.page_dpi(box.width, box.height), self.lang, max_pixels))
+        return jobs
+
+    def iter_pages(self, pdf_path: str, page_count: Optional[int] = None,
+                   pages: Optional[List[int]] = None, reader=None) -> Iterator[str]:
+        """
+        Yield the OCR text of each page, in page order, as soon as it is ready.
+        At most `window` pages are in flight, so a consumer that stops early
+        (e.g. once it has enough text) never pays for the rest of the document.
+        Pass `pages` (1-based) to OCR only those pages instead of the whole document,
+        and the caller's PdfReader for the same file as `reader` so it isn't parsed again.
+        """
+        if pages is None:
+            pages = self.page_numbers(pdf_path, page_count if reader is None else len(reader.pages))
+        jobs = self._page_jobs(pdf_path, pages, reader)
+        if self.window == 1 or len(jobs) <= 1:
+            for job in jobs:
+                yield _ocr_page(*job)
+            return
+
+        pending: Deque[Future] = deque()
+        done = 0
+        try:
+            pool = _get_pool(self.workers)
+            upcoming = iter(jobs)
+            for job in islice(upcoming, self.window):
+                pending.append(pool.submit(_ocr_page, *job))
+
+            while pending:
+                text = pending.popleft().result()
+                done += 1
+                job = next(upcoming, None)
+                if job is not None:
+                    pending.append(pool.submit(_ocr_page, *job))
+                yield text
+        except BrokenProcessPool:
+            logger.error("OCR process pool crashed, finishing document in-process")
+            _discard_pool(self.workers)
+            for job in jobs[done:]:
+                yield _ocr_page(*job)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def ocr_pdf(self, pdf_path: str, page_count: Optional[int] = None) -> List[str]:
+        """Return the OCR text of each page, in page order."""
+        return list(self.iter_pages(pdf_path, page_count))
+
+
+def get_ocr_engine() -> OCREngine:
+    """Get or create the OCR engine configured from environment"""
+    global _engine
+
+    if _engine is None:
+        _engine = OCREngine()
+    return _engine
@@ -0,0 +1,80 @@
+"""
+Small dependency-graph runner for request-time processing steps
+Each step starts as soon as the steps it depends on have finished, so
+independent work (CV extraction and the IP lookup, say) overlaps and the
+total latency is the critical path rather than the sum. The whole graph runs
+under one deadline; whatever has not finished by then is reported and dropped
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def _run_step(func: Callable, kwargs: dict):
+    try:
+        return func(**kwargs)
+    finally:
+        # Worker threads open their own database connections; don't leak them
+        connections.close_all()
+
+
+def run_steps(steps: Dict[str, Tuple[Callable, List[str]]], deadline: float, name: str = "pipeline") -> dict:
+    """
+    Run `steps` ({name: (func, [dependency names])}) within `deadline` seconds.
+    A step is called with its dependencies' results as keyword arguments; it is
+    skipped if one of them failed or timed out.
+    Returns {'results': {step: value}, 'errors': {step: message}, 'timings_ms': {step: ms}, 'elapsed_ms'}.
+    """
+    for step, (_, deps) in steps.items():
+        unknown = [d for d in deps if d not in steps]
+        if unknown:
+            raise ValueError(f"Step {step} depends on unknown steps {unknown}")
+
+    started = time.monotonic()
+    stop_at = started + deadline
+    results, errors, timings = {}, {}, {}
+    waiting = dict(steps)
+    pending = {}
+
+    executor = ThreadPoolExecutor(max_workers=len(steps) or 1, thread_name_prefix=name)
+    try:
+        while True:
+            for step, (func, deps) in list(waiting.items()):
+                failed = next((d for d in deps if d in errors), None)
+                if failed:
+                    errors[step] = f"skipped: {failed} did not complete"
+                    del waiting[step]
+                elif all(d in results for d in deps):
+                    future = executor.submit(_run_step, func, {d: results[d] for d in deps})
+                    pending[future] = (step, time.monotonic())
+                    del waiting[step]
+
+            remaining = stop_at - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, step_started = pending.pop(future)
+                timings[step] = round((time.monotonic() - step_started) * 1000, 1)
+                try:
+                    results[step] = future.result()
+                except Exception as e:
+                    logger.warning(f"{name} step {step} failed: {e}")
+                    errors[step] = str(e)
+    finally:
+        for future, (step, _) in pending.items():
+            future.cancel()
+            errors[step] = "deadline exceeded"
+        for step in waiting:
+            errors.setdefault(step, "deadline exceeded")
+        # Don't wait for steps still running past the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+    logger.info(f"{name} finished in {elapsed_ms} ms (steps {timings}, errors {errors or 'none'})")
+    return {'results': results, 'errors': errors, 'timings_ms': timings, 'elapsed_ms': elapsed_ms}
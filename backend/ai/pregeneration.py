@@ -0,0 +1,118 @@
+"""
+Speculative quiz generation after a CV upload
+The CV text and language are known once the upload pipeline finishes, so a
+small background pool generates the quiz right away and stores it in
+PregeneratedQuiz. /api/ai/generate/ then serves a ready quiz without waiting
+on Groq; if generation is still running, its own Groq call coalesces with the
+background one through the LLM client's single-flight. Entries expire after
+PREGENERATE_TTL_HOURS, and a quiz for a deleted or cancelled CV is discarded
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
+
+from django.db import connections
+from django.utils import timezone
+
+from .models import PregeneratedQuiz
+
+logger = logging.getLogger(__name__)
+
+PREGENERATE_ON_UPLOAD = os.getenv("PREGENERATE_ON_UPLOAD", "true").lower() in ("1", "true", "yes")
+PREGENERATE_WORKERS = int(os.getenv("PREGENERATE_WORKERS", "2"))
+PREGENERATE_TTL_HOURS = int(os.getenv("PREGENERATE_TTL_HOURS", "24"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        # Threads don't survive a fork; each worker gets its own pool
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=PREGENERATE_WORKERS, thread_name_prefix="pregenerate")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _still_wanted(entry_id: int) -> bool:
+    return PregeneratedQuiz.objects.filter(
+        pk=entry_id, status='pending', expires_at__gt=timezone.now()
+    ).exists()
+
+
+def _pregenerate(entry_id: int) -> None:
+    from .question_bank import build_quiz
+    from .text_cache import get_cv_text
+
+    try:
+        if not _still_wanted(entry_id):
+            return
+        entry = PregeneratedQuiz.objects.select_related('cv').get(pk=entry_id)
+        text = get_cv_text(entry.cv.file)['text']
+
+        questions = build_quiz(text, language=entry.language, job_titles=entry.cv.extracted_job_titles)
+        status = 'ready' if questions else 'failed'
+        # Only a still-pending entry is updated, so a cancel issued meanwhile wins
+        PregeneratedQuiz.objects.filter(pk=entry_id, status='pending').update(
+            questions=questions, status=status,
+        )
+        logger.info(f"Pre-generated {len(questions)} questions for CV {entry.cv_id} ({status})")
+    except PregeneratedQuiz.DoesNotExist:
+        # The CV was deleted
+        pass
+    except Exception as e:
+        logger.error(f"Pre-generation failed for entry {entry_id}: {e}", exc_info=True)
+        PregeneratedQuiz.objects.filter(pk=entry_id, status='pending').update(status='failed')
+    finally:
+        connections.close_all()
+
+
+def schedule_pregeneration(cv) -> None:
+    """Queue quiz generation for a freshly processed CV."""
+    if not PREGENERATE_ON_UPLOAD:
+        return
+
+    purge_expired()
+    entry, _ = PregeneratedQuiz.objects.update_or_create(
+        cv=cv,
+        defaults={
+            'language': cv.detected_language or 'en',
+            'status': 'pending',
+            'questions': [],
+            'expires_at': timezone.now() + timedelta(hours=PREGENERATE_TTL_HOURS),
+        },
+    )
+    _get_executor().submit(_pregenerate, entry.id)
+    logger.info(f"Scheduled quiz pre-generation for CV {cv.id}")
+
+
+async def acancel_pregeneration(cv_id: int) -> None:
+    """Stop pending pre-generation for a CV; a quiz already being generated finishes but is discarded."""
+    await PregeneratedQuiz.objects.filter(cv_id=cv_id, status='pending').aupdate(status='cancelled')
+
+
+def purge_expired() -> int:
+    deleted, _ = PregeneratedQuiz.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+async def atake_pregenerated_quiz(cv, language: str) -> Optional[list]:
+    """
+    The ready, unexpired pre-generated questions for this CV and language, marked
+    consumed so a later request (a retake) generates normally. None if there are none.
+    """
+    entry = await PregeneratedQuiz.objects.filter(
+        cv=cv, language=language, status='ready', expires_at__gt=timezone.now()
+    ).afirst()
+    if entry is None:
+        return None
+    # Two requests racing for the same entry: only the one that flips the status gets it
+    taken = await PregeneratedQuiz.objects.filter(pk=entry.pk, status='ready').aupdate(status='consumed')
+    return entry.questions if taken else None
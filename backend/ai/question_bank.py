@@ -0,0 +1,223 @@
+"""
+Question bank: validated quiz questions from past generations, reused for new CVs
+Every generated quiz is normalized and stored in BankQuestion. In 'retrieve'
+mode a new quiz is first assembled from the bank by TF-IDF similarity between
+the CV (job titles and skills-first compacted text) and each question's skill,
+job titles and text, per difficulty; Groq is only asked for the questions
+the bank could not supply
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+
+from .ai_logic import QUIZ_DIFFICULTY_COUNTS, agenerate_questions_from_cv, generate_questions_from_cv
+from .compaction import compact_cv_text
+from .llm_output import DIFFICULTIES, normalize_question, question_stem
+from .models import BankQuestion
+
+logger = logging.getLogger(__name__)
+
+# 'off': neither store nor retrieve; 'store': only collect questions; 'retrieve': collect and reuse
+QUESTION_BANK_MODE = os.getenv("QUESTION_BANK_MODE", "retrieve")
+# Minimum cosine similarity between a CV and a bank question for the question to be reused
+QUESTION_BANK_MIN_SCORE = float(os.getenv("QUESTION_BANK_MIN_SCORE", "0.2"))
+# Tokens of compacted CV text used as the retrieval query
+QUERY_TOKENS = 300
+# Recompute IDF weights once the bank has grown by this fraction since they were last computed
+IDF_REFRESH_GROWTH = 0.2
+
+_TERM_RE = re.compile(r"\w+")
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "which", "what", "when", "how", "are", "you",
+    "your", "best", "most", "following", "would", "should", "can", "its", "into", "using", "used",
+    "في", "من", "على", "إلى", "عن", "مع", "التي", "الذي", "ما", "هو", "هي", "أو",
+}
+
+_indexes: Dict[str, "_TfIdfIndex"] = {}
+_index_lock = threading.Lock()
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in _TERM_RE.findall(text.lower()) if len(t) > 2 and t not in _STOPWORDS and not t.isdigit()]
+
+
+def stem_hash(question: str, language: str) -> str:
+    return hashlib.sha256(f"{language}:{question_stem(question)}".encode("utf-8")).hexdigest()
+
+
+def _as_question(entry: BankQuestion) -> dict:
+    return {
+        'question': entry.question,
+        'options': entry.options,
+        'answer': entry.options[entry.answer_index],
+        'correctAnswer': entry.answer_index,
+        'difficulty': entry.difficulty,
+        'skill': entry.skill,
+    }
+
+
+class _TfIdfIndex:
+    """
+    Sparse TF-IDF vectors (L2-normalized) over the bank questions of one language.
+    New questions are added in place; IDF weights (and with them every vector) are
+    only recomputed once the bank has grown by IDF_REFRESH_GROWTH since the last time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.docs: Dict[int, Tuple[str, Counter]] = {}
+        self.df = Counter()
+        self.idf: Dict[str, float] = {}
+        self.vectors: Dict[int, Tuple[str, dict]] = {}
+        self._idf_docs = 0
+
+    def add(self, rows) -> None:
+        added = []
+        for pk, question, skill, job_titles, difficulty in rows:
+            # Skill and job titles are what a CV is matched on; weight them over the wording
+            text = " ".join([skill, skill, " ".join(job_titles or []), question])
+            tf = Counter(_terms(text))
+            self.docs[pk] = (difficulty, tf)
+            self.df.update(tf.keys())
+            self.last_id = max(self.last_id, pk)
+            added.append(pk)
+        if not added:
+            return
+
+        if len(self.docs) >= self._idf_docs * (1 + IDF_REFRESH_GROWTH):
+            n = len(self.docs)
+            self.idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in self.df.items()}
+            self._idf_docs = n
+            self.vectors = {pk: (difficulty, self._vector(tf)) for pk, (difficulty, tf) in self.docs.items()}
+        else:
+            for pk in added:
+                difficulty, tf = self.docs[pk]
+                self.vectors[pk] = (difficulty, self._vector(tf))
+
+    def _weight(self, term: str) -> float:
+        idf = self.idf.get(term)
+        if idf is None:
+            # A term first seen since the last refresh
+            idf = math.log((1 + self._idf_docs) / (1 + self.df[term])) + 1
+        return idf
+
+    def _vector(self, tf: Counter) -> dict:
+        vec = {term: (1 + math.log(count)) * self._weight(term) for term, count in tf.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {term: w / norm for term, w in vec.items() if w}
+
+    def search(self, query: str, difficulty: str, limit: int, min_score: float) -> List[int]:
+        qvec = self._vector(Counter(_terms(query)))
+        scored = []
+        for pk, (doc_difficulty, vec) in self.vectors.items():
+            if doc_difficulty != difficulty:
+                continue
+            score = sum(w * vec.get(term, 0.0) for term, w in qvec.items())
+            if score >= min_score:
+                scored.append((score, pk))
+        scored.sort(reverse=True)
+        return [pk for _, pk in scored[:limit]]
+
+
+def _get_index(language: str) -> _TfIdfIndex:
+    """The index for a language, brought up to date with the questions added since the last call."""
+    with _index_lock:
+        index = _indexes.setdefault(language, _TfIdfIndex())
+    with index.lock:
+        index.add(BankQuestion.objects.filter(language=language, id__gt=index.last_id)
+                  .order_by('id').values_list('id', 'question', 'skill', 'job_titles', 'difficulty'))
+    return index
+
+
+def retrieve(cv_text: str, language: str, job_titles: List[str], counts: Dict[str, int]) -> List[dict]:
+    """Up to counts[difficulty] bank questions per difficulty that match this CV."""
+    query = " ".join(job_titles or []) + "\n" + compact_cv_text(cv_text, max_tokens=QUERY_TOKENS)
+    index = _get_index(language)
+    ids = []
+    with index.lock:
+        for difficulty, n in counts.items():
+            ids += index.search(query, difficulty, n, QUESTION_BANK_MIN_SCORE)
+    if not ids:
+        return []
+    BankQuestion.objects.filter(id__in=ids).update(times_served=F('times_served') + 1)
+    by_id = BankQuestion.objects.in_bulk(ids)
+    return [_as_question(by_id[pk]) for pk in ids if pk in by_id]
+
+
+def store_questions(questions: List[dict], language: str, job_titles: List[str]) -> int:
+    """Add normalized questions to the bank; ones already there are skipped."""
+    entries = []
+    for q in questions:
+        entries.append(BankQuestion(
+            stem_hash=stem_hash(q['question'], language),
+            question=q['question'],
+            options=q['options'],
+            answer_index=q['correctAnswer'],
+            difficulty=q['difficulty'] or 'intermediate',
+            language=language,
+            skill=q['skill'],
+            job_titles=list(job_titles or [])[:3],
+        ))
+    BankQuestion.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def plan_quiz(cv_text: str, language: str, job_titles: List[str], fresh: bool = False) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Bank questions for this CV and the per-difficulty counts still to generate.
+    The counts are None when nothing came from the bank (generate the standard quiz).
+    """
+    if QUESTION_BANK_MODE != 'retrieve' or fresh:
+        return [], None
+    picked = retrieve(cv_text, language, job_titles, QUIZ_DIFFICULTY_COUNTS)
+    if not picked:
+        return [], None
+    have = Counter(q['difficulty'] for q in picked)
+    gaps = {d: n - have[d] for d, n in QUIZ_DIFFICULTY_COUNTS.items() if n > have[d]}
+    logger.info(f"Question bank supplied {len(picked)} questions; generating {sum(gaps.values())}")
+    return picked, gaps
+
+
+def finish_quiz(picked: List[dict], generated, language: str, job_titles: List[str]) -> List[dict]:
+    """Validate generated questions, add them to the bank and merge them with the bank ones."""
+    fresh_questions = [q for q in map(normalize_question, generated or []) if q]
+    if QUESTION_BANK_MODE != 'off' and fresh_questions:
+        store_questions(fresh_questions, language, job_titles)
+
+    seen = {stem_hash(q['question'], language) for q in picked}
+    merged = list(picked)
+    for q in fresh_questions:
+        h = stem_hash(q['question'], language)
+        if h not in seen:
+            seen.add(h)
+            merged.append(q)
+    order = {d: i for i, d in enumerate(DIFFICULTIES)}
+    return sorted(merged, key=lambda q: order.get(q['difficulty'], 1))
+
+
+def build_quiz(cv_text: str, language: str = 'en', job_titles: Optional[List[str]] = None, fresh: bool = False) -> List[dict]:
+    """A quiz from the bank where possible, with Groq generating the rest."""
+    job_titles = job_titles or []
+    picked, gaps = plan_quiz(cv_text, language, job_titles, fresh)
+    generated = generate_questions_from_cv(cv_text, language=language, fresh=fresh, counts=gaps) \
+        if gaps is None or gaps else []
+    return finish_quiz(picked, generated, language, job_titles)
+
+
+async def abuild_quiz(cv_text: str, language: str = 'en', job_titles: Optional[List[str]] = None,
+                      fresh: bool = False) -> List[dict]:
+    """Async version of build_quiz, for async views."""
+    job_titles = job_titles or []
+    picked, gaps = await sync_to_async(plan_quiz)(cv_text, language, job_titles, fresh)
+    generated = await agenerate_questions_from_cv(cv_text, language=language, fresh=fresh, counts=gaps) \
+        if gaps is None or gaps else []
+    return await sync_to_async(finish_quiz)(picked, generated, language, job_titles)
@@ -0,0 +1,193 @@
+"""
+Single-flight coalescing of identical concurrent work across threads and workers
+The first caller for a key takes an exclusive file lock and runs the work;
+callers arriving meanwhile mark that they are waiting, wait on the lock and
+get the leader's result from a small JSON file instead of repeating the work.
+The result file is only written when someone is waiting, is private to the
+app's user and is removed after a short grace period. If the leader fails (or
+a waiter misses the result), the waiter runs the work itself
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", str(Path(__file__).resolve().parent.parent / "singleflight"))
+# How long a waiter waits for the leader before doing the work itself
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", "90"))
+# Results may hold personal data (extracted CV fields); they are deleted this long after
+# the leader finishes, which is ample for waiters already queued on the lock
+SINGLEFLIGHT_RESULT_GRACE = float(os.getenv("SINGLEFLIGHT_RESULT_GRACE", "5"))
+# Leftover lock files older than this are removed
+_STALE_AFTER = 3600
+_POLL_INTERVAL = 0.1
+
+_flight: Optional["SingleFlight"] = None
+
+
+class SingleFlight:
+    """Coalesces calls per key. Results must be JSON-serializable."""
+
+    def __init__(self, directory: str = SINGLEFLIGHT_DIR, wait: float = SINGLEFLIGHT_WAIT):
+        self.directory = directory
+        self.wait = wait
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+        self._last_cleanup = 0.0
+
+    def _paths(self, key) -> Tuple[str, str, str]:
+        name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + ".lock", base + ".json", base + ".waiting"
+
+    def _open_lock(self, lock_path: str):
+        return os.fdopen(os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600), "r+")
+
+    def _mark_waiting(self, waiting_path: str) -> None:
+        os.close(os.open(waiting_path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.utime(waiting_path)
+
+    def _has_waiters(self, waiting_path: str, since: float) -> bool:
+        try:
+            return os.path.getmtime(waiting_path) >= since
+        except OSError:
+            return False
+
+    def _try_lock(self, fh) -> bool:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _load(self, result_path: str, since: float):
+        """The leader's result, if it finished after `since`."""
+        try:
+            with open(result_path, encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('finished_at', 0) >= since else None
+
+    def _save(self, result_path: str, result) -> float:
+        finished_at = time.time()
+        tmp = f"{result_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as fh:
+            json.dump({'finished_at': finished_at, 'result': result}, fh, ensure_ascii=False)
+        os.replace(tmp, result_path)
+        self._cleanup()
+        return finished_at
+
+    def _discard(self, result_path: str, waiting_path: str, finished_at: float) -> None:
+        """Remove a result once its grace period is over, unless a later leader replaced it."""
+        entry = self._load(result_path, 0)
+        if entry and entry.get('finished_at') != finished_at:
+            return
+        for path in (result_path, waiting_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _finish(self, result_path: str, waiting_path: str, started: float, result) -> Optional[float]:
+        """Publish the result for waiters, if there are any. Returns its finished_at."""
+        if not self._has_waiters(waiting_path, started):
+            return None
+        return self._save(result_path, result)
+
+    def _cleanup(self) -> None:
+        now = time.time()
+        if now - self._last_cleanup < _STALE_AFTER:
+            return
+        self._last_cleanup = now
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > _STALE_AFTER:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def do(self, key, fn: Callable[[], Any], wait: Optional[float] = None):
+        """
+        Run fn() once for all concurrent callers with the same key and return its result.
+        A caller waits at most `wait` seconds (default SINGLEFLIGHT_WAIT) for the leader.
+        """
+        wait = self.wait if wait is None else wait
+        lock_path, result_path, waiting_path = self._paths(key)
+        with self._open_lock(lock_path) as fh:
+            if not self._try_lock(fh):
+                arrived = time.time()
+                self._mark_waiting(waiting_path)
+                while not self._try_lock(fh):
+                    if time.time() - arrived > wait:
+                        logger.warning(f"Single-flight wait for {key} timed out; running it here")
+                        return fn()
+                    time.sleep(_POLL_INTERVAL)
+                entry = self._load(result_path, arrived)
+                if entry:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                    logger.info(f"Single-flight shared result for {key}")
+                    return entry['result']
+            finished_at = None
+            try:
+                started = time.time()
+                os.utime(lock_path)
+                result = fn()
+                finished_at = self._finish(result_path, waiting_path, started, result)
+                return result
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                if finished_at is not None:
+                    timer = threading.Timer(SINGLEFLIGHT_RESULT_GRACE, self._discard,
+                                            (result_path, waiting_path, finished_at))
+                    timer.daemon = True
+                    timer.start()
+
+    async def ado(self, key, fn: Callable[[], Awaitable[Any]], wait: Optional[float] = None):
+        """Async version of do(); waiting polls the lock without blocking the event loop."""
+        wait = self.wait if wait is None else wait
+        lock_path, result_path, waiting_path = self._paths(key)
+        with self._open_lock(lock_path) as fh:
+            if not self._try_lock(fh):
+                arrived = time.time()
+                self._mark_waiting(waiting_path)
+                while not self._try_lock(fh):
+                    if time.time() - arrived > wait:
+                        logger.warning(f"Single-flight wait for {key} timed out; running it here")
+                        return await fn()
+                    await asyncio.sleep(_POLL_INTERVAL)
+                entry = self._load(result_path, arrived)
+                if entry:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                    logger.info(f"Single-flight shared result for {key}")
+                    return entry['result']
+            finished_at = None
+            try:
+                started = time.time()
+                os.utime(lock_path)
+                result = await fn()
+                finished_at = await asyncio.to_thread(self._finish, result_path, waiting_path, started, result)
+                return result
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+                if finished_at is not None:
+                    asyncio.get_running_loop().call_later(
+                        SINGLEFLIGHT_RESULT_GRACE, self._discard, result_path, waiting_path, finished_at)
+
+
+def get_single_flight() -> SingleFlight:
+    """Get or create the process-wide SingleFlight (it holds no fork-sensitive state)."""
+    global _flight
+
+    if _flight is None:
+        _flight = SingleFlight()
+    return _flight
@@ -1,3 +1,936 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth.models import User
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ai import ai_logic
+from ai.ai_logic import (
+    _accept_questions, _generate_first_pass, _page_problem, _repair_presentation_forms, _shards,
+    detect_language_details, extract_document, extract_docx, generate_questions_from_cv,
+)
+from ai.compaction import compact_cv_text, estimate_tokens
+from ai.hedging import HedgeBudget
+from ai.llm_cache import LLMCache
+from ai.llm_client import AsyncGroqClient, GroqClient, LLMError
+from ai.llm_output import normalize_question, normalize_text_item, parse_array, parse_object
+from ai.model_routing import LatencyTracker, ModelRouter
+from ai.models import BankQuestion, PregeneratedQuiz
+from ai.ocr import OCREngine
+from ai.pipeline import run_steps
+from ai.pregeneration import _pregenerate, acancel_pregeneration, atake_pregenerated_quiz
+from ai.question_bank import finish_quiz, plan_quiz, store_questions
+from ai.singleflight import SingleFlight
+from cv.models import CV
+
+
+class CompactCvTextTests(SimpleTestCase):
+    def _long_cv(self):
+        header = ["Jordan Haddad", "Riyadh, Saudi Arabia", "+966 55 123 4567", "jordan.haddad@example.com"]
+        skills = ["Skills"] + [f"Python, Django, PostgreSQL, Docker, Kubernetes, AWS, Terraform #{i}" for i in range(150)]
+        experience = ["Experience"] + [f"Senior Backend Engineer, Company {i}, 2015 - 2019: built payment APIs"
+                                       for i in range(150)]
+        return "\n".join(header + skills + experience)
+
+    def test_keep_contact_keeps_header_on_long_cv(self):
+        text = self._long_cv()
+        self.assertGreater(estimate_tokens(text), 3000)
+
+        compact = compact_cv_text(text, max_tokens=1200, keep_contact=True)
+
+        self.assertTrue(compact.startswith("Jordan Haddad"))
+        self.assertIn("+966 55 123 4567", compact)
+        self.assertIn("Riyadh, Saudi Arabia", compact)
+        self.assertLessEqual(estimate_tokens(compact), 1200 + compact.count("\n") + 1)
+
+    def test_default_priority_drops_contact_lines(self):
+        compact = compact_cv_text(self._long_cv(), max_tokens=1200)
+
+        self.assertNotIn("+966", compact)
+        self.assertNotIn("@example.com", compact)
+
+    def test_custom_priority(self):
+        compact = compact_cv_text(self._long_cv(), max_tokens=200, priority=['experience'])
+
+        self.assertIn("Senior Backend Engineer", compact)
+        self.assertNotIn("Kubernetes", compact)
+
+
+class FeedbackStreamTests(TestCase):
+    """Feedback for a result that submit saved to Supabase streams from the SSE endpoint."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("candidate", password="pw")
+        self.quiz_cv_id = 3
+        self.results = {}
+        self.feedback = {}
+        questions = [
+            {"id": 1, "quiz_id": 7, "text": "What is 2 + 2?", "options": ["3", "4"], "correct_answer": 1},
+            {"id": 2, "quiz_id": 7, "text": "Capital of France?", "options": ["Paris", "Rome"], "correct_answer": 0},
+        ]
+
+        def save_result(quiz_id, user_id, score, answers):
+            row = {"id": len(self.results) + 1, "quiz_id": quiz_id, "user_id": user_id,
+                   "score": score, "answers": answers}
+            self.results[row["id"]] = row
+            return row
+
+        def save_feedback(**row):
+            row["id"] = len(self.feedback) + 1
+            self.feedback[row["result_id"]] = row
+            return row
+
+        async def stream_feedback(wrong_answers, percent):
+            self.prompted = (wrong_answers, percent)
+            yield "Review "
+            yield "arithmetic."
+
+        patches = {
+            "get_quiz_questions": lambda quiz_id: questions,
+            "save_result_to_supabase": save_result,
+            "get_result_by_id": self.results.get,
+            "get_result_feedback": self.feedback.get,
+            "get_quiz_by_id": lambda quiz_id: {"id": quiz_id, "cv_id": self.quiz_cv_id},
+            "save_feedback_to_supabase": save_feedback,
+            "astream_feedback_from_ai": stream_feedback,
+        }
+        for name, replacement in patches.items():
+            patcher = mock.patch(f"ai.views.{name}", replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _stream(self, url):
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_streams_feedback_for_submitted_result(self):
+        await self.async_client.aforce_login(self.user)
+        submitted = await self.async_client.post(
+            reverse("ai-submit"),
+            {"quiz_id": 7, "answers": [{"answer": 0}, {"answer": 0}]},
+            content_type="application/json",
+        )
+        url = submitted.json()["feedback_stream"]
+
+        body = await self._stream(url)
+
+        self.assertIn('"text": "Review "', body)
+        self.assertIn("event: done", body)
+        self.assertEqual(self.prompted, ([{"question": "What is 2 + 2?", "chosen": "3", "correct": "4"}], 50))
+        result_id = submitted.json()["result_id"]
+        self.assertEqual(self.feedback[result_id]["content"], "Review arithmetic.")
+        # A second request replays the saved text instead of calling the model again
+        self.assertIn('"text": "Review arithmetic."', await self._stream(url))
+
+    async def test_feedback_without_a_cv_is_streamed_but_not_saved(self):
+        self.quiz_cv_id = None
+        self.results[1] = {"id": 1, "quiz_id": 7, "user_id": self.user.id, "score": 100, "answers": []}
+        await self.async_client.aforce_login(self.user)
+
+        body = await self._stream(reverse("ai-feedback-stream", args=[1]))
+
+        self.assertIn('"text": "Review "', body)
+        self.assertIn('event: done\ndata: {"feedback_id": null}', body)
+        self.assertEqual(self.feedback, {})
+
+    async def test_other_users_result_is_not_found(self):
+        self.results[1] = {"id": 1, "quiz_id": 7, "user_id": self.user.id + 1, "score": 0, "answers": []}
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse("ai-feedback-stream", args=[1]))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class PresentationFormTextLayerTests(SimpleTestCase):
+    # "مرحبا" as presentation-form glyphs, then a lam-alef ligature
+    LOGICAL = "ﻣﺮﺣﺒﺎ ﻟﻼ"
+
+    def test_reversed_glyphs_become_logical_base_letters(self):
+        visual = self.LOGICAL[::-1] + " 2024 - 2020"
+
+        self.assertEqual(_repair_presentation_forms(visual), "2020 - 2024 مرحبا للا")
+
+    def test_logical_order_is_only_normalized(self):
+        self.assertEqual(_repair_presentation_forms(self.LOGICAL), "مرحبا للا")
+
+    def test_arabic_page_is_not_sent_to_latin_ocr(self):
+        page = ("�" + "مرحبا بكم ") * 8
+
+        self.assertEqual(_page_problem(page, "eng+fra"), None)
+        self.assertEqual(_page_problem(page, "ara+eng"), "garbled")
+
+
+class HedgeBudgetTests(SimpleTestCase):
+    def test_first_slow_call_can_be_hedged(self):
+        budget = HedgeBudget(max_rate=0.05, burst=2, path=None)
+        budget.note_request()
+
+        self.assertTrue(budget.try_acquire())
+
+    def test_long_run_rate_is_capped(self):
+        budget = HedgeBudget(max_rate=0.05, burst=2, path=None)
+        hedges = 0
+        for _ in range(1000):
+            budget.note_request()
+            hedges += budget.try_acquire()
+
+        self.assertLessEqual(hedges, 2 + 0.05 * 1000)
+        self.assertGreaterEqual(hedges, 0.05 * 1000)
+        self.assertFalse(budget.try_acquire())
+
+    def test_workers_share_one_budget_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "hedge_budget.json")
+        workers = [HedgeBudget(max_rate=0.05, burst=2, path=path) for _ in range(3)]
+
+        granted = [worker.try_acquire() for worker in workers]
+
+        self.assertEqual(granted, [True, True, False])
+        for worker in workers * 7:
+            worker.note_request()
+        self.assertEqual([worker.try_acquire() for worker in workers], [True, False, False])
+
+
+def _question(n, answer="Option A", **extra):
+    return {"question": f"Question {n}?", "options": ["Option A", "Option B", "Option C", "Option D"],
+            "answer": answer, **extra}
+
+
+class ParseArrayTests(SimpleTestCase):
+    def test_truncated_array_keeps_complete_items(self):
+        content = json.dumps([_question(1), _question(2)])[:-40]
+
+        items, report = parse_array(content)
+
+        self.assertEqual(items, [_question(1)])
+        self.assertTrue(report["truncated"])
+        self.assertEqual(report["dropped"], [{"index": 1, "reason": "truncated"}])
+
+    def test_braces_and_brackets_inside_strings(self):
+        content = '[{"question": "What does {x} ] mean?", "answer": "a \\"}\\" brace"}, {"question": "Next"}]'
+
+        items, report = parse_array(content)
+
+        self.assertEqual([i["question"] for i in items], ["What does {x} ] mean?", "Next"])
+        self.assertEqual(items[0]["answer"], 'a "}" brace')
+        self.assertEqual(report["dropped"], [])
+
+    def test_trailing_commas(self):
+        items, report = parse_array('[{"question": "One", "options": ["a", "b",],}, {"question": "Two"},]')
+
+        self.assertEqual([i["question"] for i in items], ["One", "Two"])
+        self.assertEqual(items[0]["options"], ["a", "b"])
+        self.assertFalse(report["truncated"])
+
+    def test_string_items(self):
+        items, report = parse_array('```json\n["Tell me about Django.", "  ", {"q": 1}, "Why Python?"]\n```',
+                                    item_type=str, validate=normalize_text_item)
+
+        self.assertEqual(items, ["Tell me about Django.", "Why Python?"])
+        self.assertEqual(report["dropped"], [{"index": 1, "reason": "failed validation"},
+                                             {"index": 2, "reason": "not a str"}])
+
+    def test_prose_brackets_before_the_array(self):
+        items, report = parse_array('Note [1]: see [the docs].\n[{"question": "One"}, {"question": "Two"}]')
+
+        self.assertEqual([i["question"] for i in items], ["One", "Two"])
+        self.assertEqual(report["kept"], 2)
+
+    def test_no_array_is_reported(self):
+        items, report = parse_array("Sorry, I can't help with that.")
+
+        self.assertEqual(items, [])
+        self.assertEqual(report["dropped"], [{"index": None, "reason": "no JSON array in output"}])
+
+    def test_invalid_items_are_dropped_with_their_index(self):
+        content = json.dumps([_question(1), {"question": "No options"}, _question(3)])
+
+        items, report = parse_array(content, validate=normalize_question)
+
+        self.assertEqual([i["question"] for i in items], ["Question 1?", "Question 3?"])
+        self.assertEqual(report["dropped"], [{"index": 1, "reason": "failed validation"}])
+
+
+class NormalizeQuestionTests(SimpleTestCase):
+    def test_answer_resolves_from_text_letter_or_index(self):
+        for answer in ("option c", "C", "c)", 2, "2"):
+            with self.subTest(answer=answer):
+                question = normalize_question(_question(1, answer=answer))
+                self.assertEqual(question["correctAnswer"], 2)
+                self.assertEqual(question["answer"], "Option C")
+
+    def test_correct_answer_key_is_accepted(self):
+        raw = _question(1, difficulty="Advanced")
+        del raw["answer"]
+        raw["correctAnswer"] = 1
+
+        question = normalize_question(raw)
+
+        self.assertEqual(question["answer"], "Option B")
+        self.assertEqual(question["difficulty"], "advanced")
+
+    def test_unusable_questions_are_rejected(self):
+        duplicate_options = dict(_question(1), options=["A", "a", "B", "C"])
+        three_options = dict(_question(1), options=["A", "B", "C"])
+        for raw in (duplicate_options, three_options, _question(1, answer="E"), _question(1, answer=4),
+                    _question(1, answer=True), dict(_question(1), question=" "), "not a dict"):
+            with self.subTest(raw=raw):
+                self.assertIsNone(normalize_question(raw))
+
+
+class ParseObjectTests(SimpleTestCase):
+    def test_object_inside_prose(self):
+        obj, report = parse_object('Here you go: {"name": "Sara {Al}", "city": "Jeddah",} Thanks!')
+
+        self.assertEqual(obj, {"name": "Sara {Al}", "city": "Jeddah"})
+        self.assertEqual(report, {"truncated": False, "salvaged": False})
+
+    def test_truncated_object_keeps_complete_members(self):
+        obj, report = parse_object('{"name": "Sara", "skills": ["Python", "SQL"], "summary": "Backend eng')
+
+        self.assertEqual(obj, {"name": "Sara", "skills": ["Python", "SQL"]})
+        self.assertEqual(report, {"truncated": True, "salvaged": True})
+
+    def test_malformed_member_is_salvaged(self):
+        obj, report = parse_object('{"name": "Sara", "phone": +966 55, "city": "Riyadh"}')
+
+        self.assertEqual(obj, {"name": "Sara"})
+        self.assertTrue(report["salvaged"])
+
+    def test_no_object(self):
+        self.assertEqual(parse_object("no json here"), (None, {"truncated": False, "salvaged": False}))
+
+
+def _graded(n, difficulty):
+    return normalize_question(_question(n, difficulty=difficulty))
+
+
+class QuizTopUpTests(SimpleTestCase):
+    COUNTS = {'easy': 2, 'intermediate': 1, 'advanced': 1}
+
+    def test_accept_counts_what_is_missing(self):
+        questions = [_graded(1, "easy"), _graded(2, "easy"), _graded(3, "easy"), _graded(4, "advanced")]
+
+        accepted, missing = _accept_questions(questions, self.COUNTS)
+
+        self.assertEqual([q['question'] for q in accepted], ["Question 1?", "Question 2?", "Question 4?"])
+        self.assertEqual(missing, {'intermediate': 1})
+
+    def test_accept_skips_repeated_stems_and_places_unlabelled_questions(self):
+        accepted, _ = _accept_questions([_graded(1, "easy")], self.COUNTS)
+        repeat = dict(_graded(1, "advanced"), question="question 1")
+        unlabelled = _graded(5, None)
+
+        accepted, missing = _accept_questions([repeat, unlabelled], self.COUNTS, accepted)
+
+        self.assertEqual([q['question'] for q in accepted], ["Question 1?", "Question 5?"])
+        self.assertEqual(accepted[1]['difficulty'], "easy")
+        self.assertEqual(missing, {'intermediate': 1, 'advanced': 1})
+
+    def test_top_up_asks_only_for_dropped_questions(self):
+        first = [_question(1, difficulty="easy"), _question(2, difficulty="easy"),
+                 {"question": "Broken", "options": ["A"], "answer": "A", "difficulty": "advanced"},
+                 _question(3, difficulty="intermediate")]
+        client = mock.Mock()
+        client.chat.side_effect = [json.dumps(first), json.dumps([_question(4, difficulty="advanced")])]
+
+        with mock.patch("ai.ai_logic.get_llm_client", return_value=client):
+            questions = generate_questions_from_cv("Python developer", counts=self.COUNTS)
+
+        self.assertEqual(len(questions), 4)
+        self.assertEqual(client.chat.call_count, 2)
+        topup_prompt = client.chat.call_args.args[0]
+        self.assertIn("Include 1 advanced questions", topup_prompt)
+        self.assertIn("Question 1?", topup_prompt)
+        self.assertEqual(client.chat.call_args.kwargs['task'], 'quiz_topup')
+
+    def test_failed_top_up_keeps_the_first_pass(self):
+        client = mock.Mock()
+        client.chat.side_effect = [json.dumps([_question(1, difficulty="easy")]), LLMError("rate limited")]
+
+        with mock.patch("ai.ai_logic.get_llm_client", return_value=client):
+            questions = generate_questions_from_cv("Python developer", counts=self.COUNTS)
+
+        self.assertEqual([q['question'] for q in questions], ["Question 1?"])
+
+
+class RunStepsTests(SimpleTestCase):
+    def test_dependencies_get_results_and_failures_skip_dependents(self):
+        def fail():
+            raise RuntimeError("OCR failed")
+
+        outcome = run_steps({
+            'text': (lambda: "cv text", []),
+            'info': (lambda text: text.upper(), ['text']),
+            'broken': (fail, []),
+            'after_broken': (lambda broken: broken, ['broken']),
+        }, deadline=5)
+
+        self.assertEqual(outcome['results'], {'text': "cv text", 'info': "CV TEXT"})
+        self.assertEqual(outcome['errors'], {'broken': "OCR failed",
+                                             'after_broken': "skipped: broken did not complete"})
+
+    def test_deadline_drops_slow_steps_and_their_dependents(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        started = time.monotonic()
+        outcome = run_steps({
+            'fast': (lambda: 1, []),
+            'slow': (lambda: release.wait(5), []),
+            'after_slow': (lambda slow: slow, ['slow']),
+        }, deadline=0.2)
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(outcome['results'], {'fast': 1})
+        self.assertEqual(outcome['errors'], {'slow': "deadline exceeded", 'after_slow': "deadline exceeded"})
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            run_steps({'info': (lambda text: text, ['text'])}, deadline=1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.flight = SingleFlight(directory=directory.name, wait=5)
+        self.waiting_path = self.flight._paths("key")[2]
+
+    def _when_waiting(self, release):
+        """Let the leader finish once a waiter has queued on its lock."""
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.waiting_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+
+    def _run_leader_and_waiter(self, leader_fn):
+        entered, outcome = threading.Event(), {}
+
+        def work():
+            entered.set()
+            return leader_fn()
+
+        def lead():
+            try:
+                outcome['leader'] = self.flight.do("key", work)
+            except Exception as e:
+                outcome['leader_error'] = e
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        entered.wait(5)
+        waiter_calls = []
+        waiter = threading.Thread(target=lambda: outcome.setdefault(
+            'waiter', self.flight.do("key", lambda: waiter_calls.append(1) or "waiter's own")))
+        waiter.start()
+        leader.join(10)
+        waiter.join(10)
+        return outcome, waiter_calls
+
+    def test_waiter_gets_the_leaders_result(self):
+        release = threading.Event()
+        threading.Thread(target=self._when_waiting, args=(release,)).start()
+
+        outcome, waiter_calls = self._run_leader_and_waiter(lambda: release.wait(5) and {"quiz": [1, 2]})
+
+        self.assertEqual(outcome['leader'], {"quiz": [1, 2]})
+        self.assertEqual(outcome['waiter'], {"quiz": [1, 2]})
+        self.assertEqual(waiter_calls, [])
+
+    def test_waiter_runs_the_work_when_the_leader_fails(self):
+        release = threading.Event()
+        threading.Thread(target=self._when_waiting, args=(release,)).start()
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError("Groq unavailable")
+
+        outcome, waiter_calls = self._run_leader_and_waiter(fail)
+
+        self.assertIsInstance(outcome['leader_error'], RuntimeError)
+        self.assertEqual(outcome['waiter'], "waiter's own")
+        self.assertEqual(waiter_calls, [1])
+
+    def test_async_waiter_runs_the_work_when_the_leader_fails(self):
+        async def scenario():
+            release = asyncio.Event()
+
+            async def fail():
+                await release.wait()
+                raise RuntimeError("Groq unavailable")
+
+            async def own():
+                return "waiter's own"
+
+            leader = asyncio.create_task(self.flight.ado("key", fail))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.create_task(self.flight.ado("key", own))
+            while not os.path.exists(self.waiting_path):
+                await asyncio.sleep(0.01)
+            release.set()
+            return await asyncio.gather(leader, waiter, return_exceptions=True)
+
+        leader_result, waiter_result = asyncio.run(asyncio.wait_for(scenario(), 10))
+
+        self.assertIsInstance(leader_result, RuntimeError)
+        self.assertEqual(waiter_result, "waiter's own")
+
+
+class LLMCacheTests(SimpleTestCase):
+    def test_cache_files_are_private(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "llm_cache.sqlite3")
+        old_umask = os.umask(0o022)
+        self.addCleanup(os.umask, old_umask)
+
+        cache = LLMCache(path)
+        cache.set("key", '{"name": "Sara", "phone": "+966 55 123 4567"}')
+
+        self.assertEqual(cache.get("key"), '{"name": "Sara", "phone": "+966 55 123 4567"}')
+        for name in os.listdir(directory.name):
+            with self.subTest(name=name):
+                self.assertEqual(os.stat(os.path.join(directory.name, name)).st_mode & 0o777, 0o600)
+
+    def test_existing_cache_file_is_locked_down(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "llm_cache.sqlite3")
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+        os.chmod(path, 0o644)
+
+        LLMCache(path).get("key")
+
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+
+class MigrationTests(SimpleTestCase):
+    def test_ai_app_is_migrated(self):
+        # An unmigrated app only gets its tables from the test runner's syncdb, never from migrate
+        self.assertIn("ai", MigrationLoader(None).migrated_apps)
+
+
+def _groq_response(status, content="", retry_after=None):
+    response = mock.Mock(status_code=status, text=f"status {status}",
+                         headers={"Retry-After": retry_after} if retry_after else {})
+    response.json.return_value = {"model": "m", "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+                                  "choices": [{"message": {"content": content}, "finish_reason": "stop"}]}
+    return response
+
+
+class GroqClientTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ModelRouter(routes={'quiz': {'models': ["primary", "fallback"], 'slo_ms': 1000}})
+        patchers = [mock.patch("ai.llm_client.get_router", return_value=self.router),
+                    mock.patch("ai.llm_client.get_llm_cache", return_value=None),
+                    mock.patch("ai.llm_client.time.sleep")]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        _, _, self.sleep = [patcher.start() for patcher in patchers]
+        self.client = GroqClient("key", max_retries=2, backoff_base=0.1)
+        self.client.session = mock.Mock()
+
+    def _chat(self, **kwargs):
+        return self.client.chat("Prompt", temperature=0, max_tokens=10, fresh=True, **kwargs)
+
+    def test_retries_server_errors_with_backoff(self):
+        self.client.session.post.side_effect = [_groq_response(503), _groq_response(200, "ok")]
+
+        self.assertEqual(self._chat(model="m"), "ok")
+        self.assertEqual(self.client.session.post.call_count, 2)
+        (delay,), _ = self.sleep.call_args
+        self.assertLessEqual(delay, 0.1)
+
+    def test_honours_retry_after(self):
+        self.client.session.post.side_effect = [_groq_response(429, retry_after="2"), _groq_response(200, "ok")]
+
+        self.assertEqual(self._chat(model="m"), "ok")
+        self.sleep.assert_called_once_with(2.0)
+
+    def test_retry_after_past_the_budget_fails_at_once(self):
+        self.client.session.post.return_value = _groq_response(429, retry_after="60")
+
+        with self.assertRaises(LLMError) as raised:
+            self._chat(model="m", timeout=5)
+
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(self.client.session.post.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_gives_up_after_max_retries(self):
+        self.client.session.post.return_value = _groq_response(500)
+
+        with self.assertRaises(LLMError):
+            self._chat(model="m")
+
+        self.assertEqual(self.client.session.post.call_count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.client.session.post.return_value = _groq_response(400)
+
+        with self.assertRaises(LLMError):
+            self._chat(model="m")
+
+        self.assertEqual(self.client.session.post.call_count, 1)
+
+    def test_fails_over_to_the_next_routed_model(self):
+        self.client.session.post.side_effect = [_groq_response(400), _groq_response(200, "from fallback")]
+
+        self.assertEqual(self._chat(task="quiz"), "from fallback")
+        models = [c.kwargs["json"]["model"] for c in self.client.session.post.call_args_list]
+        self.assertEqual(models, ["primary", "fallback"])
+        # The failure counts against the primary's latency
+        self.assertEqual(len(self.router.tracker._recent("quiz", "primary")), 1)
+
+
+class AsyncGroqClientTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ModelRouter(routes={'feedback': {'models': ["m"], 'slo_ms': 1000}})
+        patcher = mock.patch("ai.llm_client.get_router", return_value=self.router)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, responses):
+        responses = iter(responses)
+        client = AsyncGroqClient("key", backoff_base=0)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(responses)))
+        return client
+
+    def test_retries_before_answering(self):
+        ok = {"choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}]}
+        client = self._client([httpx.Response(502), httpx.Response(200, json=ok)])
+
+        content = asyncio.run(client.chat("Prompt", temperature=0, max_tokens=10, model="m"))
+
+        self.assertEqual(content, "ok")
+
+    def test_malformed_stream_line_raises_llm_error(self):
+        body = 'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\ndata:\n\ndata: {"choices": [\n\n'
+        client = self._client([httpx.Response(200, text=body)])
+
+        async def read():
+            chunks = []
+            with self.assertRaises(LLMError):
+                async for chunk in client.stream_chat("Prompt", temperature=0, max_tokens=10, task="feedback",
+                                                      fresh=True):
+                    chunks.append(chunk)
+            return chunks
+
+        with mock.patch("ai.llm_client.get_llm_cache", return_value=None):
+            self.assertEqual(asyncio.run(read()), ["Hi"])
+        self.assertEqual(len(self.router.tracker._recent("feedback", "m")), 1)
+
+
+class ModelRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ModelRouter(routes={'quiz': {'models': ["primary", "fallback"], 'slo_ms': 1000}},
+                                  tracker=LatencyTracker(min_samples=5))
+
+    def test_slow_primary_is_demoted_and_restored(self):
+        now = [1000.0]
+        with mock.patch("ai.model_routing.time.monotonic", side_effect=lambda: now[0]):
+            for _ in range(5):
+                self.router.record('quiz', "primary", 1500)
+            self.assertEqual(self.router.candidates('quiz'), ["fallback", "primary"])
+
+            # The slow samples age out of the window and fast ones bring the p95 back under the SLO
+            now[0] += self.router.tracker.window + 1
+            for _ in range(5):
+                self.router.record('quiz', "primary", 400)
+            self.assertEqual(self.router.candidates('quiz'), ["primary", "fallback"])
+
+    def test_too_few_samples_keep_the_configured_order(self):
+        for _ in range(4):
+            self.router.record('quiz', "primary", 5000)
+
+        self.assertEqual(self.router.candidates('quiz'), ["primary", "fallback"])
+
+    def test_failed_call_counts_as_twice_the_slo(self):
+        self.router.record('quiz', "primary", 10, ok=False)
+
+        self.assertEqual(self.router.tracker._recent('quiz', "primary"), [2000])
+
+
+class OCREngineTests(SimpleTestCase):
+    def test_page_jobs_reuse_the_callers_reader(self):
+        letter = mock.Mock(mediabox=mock.Mock(width=612, height=792))
+        reader = mock.Mock(pages=[letter] * 30)
+        engine = OCREngine(dpi=200, workers=2, max_memory_mb=256)
+
+        with mock.patch("PyPDF2.PdfReader") as pdf_reader:
+            jobs = engine._page_jobs("cv.pdf", [3, 29], reader)
+
+        pdf_reader.assert_not_called()
+        self.assertEqual([(job[1], job[2]) for job in jobs], [(3, 200), (29, 200)])
+
+
+@mock.patch.dict("ai.question_bank._indexes", clear=True)
+@mock.patch("ai.question_bank.QUIZ_DIFFICULTY_COUNTS", {'easy': 2, 'intermediate': 1, 'advanced': 1})
+@mock.patch("ai.question_bank.QUESTION_BANK_MODE", "retrieve")
+class QuestionBankTests(TestCase):
+    CV = "Backend developer\nSkills\nPython, Django, Django REST Framework, PostgreSQL"
+
+    def setUp(self):
+        bank = [
+            ("What does Django's ORM select_related do?", "Django", "easy"),
+            ("Which Django setting lists installed apps?", "Django", "easy"),
+            ("How should a nurse record patient vitals?", "Patient care", "easy"),
+            ("How do you avoid N+1 queries in Django REST Framework serializers?", "Django", "advanced"),
+        ]
+        store_questions([{'question': text, 'options': ["A", "B", "C", "D"], 'correctAnswer': 0,
+                          'difficulty': difficulty, 'skill': skill} for text, skill, difficulty in bank],
+                        'en', ["Backend Developer"])
+
+    def test_plan_reuses_matching_questions_and_generates_the_gaps(self):
+        picked, gaps = plan_quiz(self.CV, 'en', ["Backend Developer"])
+
+        self.assertEqual(len(picked), 3)
+        self.assertTrue(all(q['skill'] == "Django" for q in picked))
+        self.assertEqual(gaps, {'intermediate': 1})
+        self.assertEqual(BankQuestion.objects.filter(times_served=1).count(), 3)
+
+    def test_fresh_or_unmatched_cv_generates_the_whole_quiz(self):
+        self.assertEqual(plan_quiz(self.CV, 'en', [], fresh=True), ([], None))
+        self.assertEqual(plan_quiz("Pastry chef: croissants, laminated dough", 'en', []), ([], None))
+        self.assertEqual(plan_quiz(self.CV, 'ar', []), ([], None))
+
+    def test_new_questions_are_indexed_without_a_rebuild(self):
+        store_questions([{'question': "When would you use a Django signal?", 'options': ["A", "B", "C", "D"],
+                          'correctAnswer': 1, 'difficulty': 'intermediate', 'skill': "Django"}], 'en', [])
+        plan_quiz(self.CV, 'en', [])
+
+        picked, gaps = plan_quiz(self.CV, 'en', [])
+
+        self.assertIn("When would you use a Django signal?", [q['question'] for q in picked])
+        self.assertEqual(gaps, {})
+
+    def test_finish_stores_valid_questions_and_merges_without_repeats(self):
+        picked, _ = plan_quiz(self.CV, 'en', [])
+        generated = [
+            {'question': "What is a Django migration?", 'options': ["W", "X", "Y", "Z"], 'answer': "X",
+             'difficulty': "intermediate", 'skill': "Django"},
+            dict(picked[0], question=picked[0]['question'].upper()),
+            {'question': "Missing options", 'answer': "A"},
+        ]
+
+        quiz = finish_quiz(picked, generated, 'en', [])
+
+        self.assertEqual([q['difficulty'] for q in quiz], ['easy', 'easy', 'intermediate', 'advanced'])
+        self.assertTrue(BankQuestion.objects.filter(question="What is a Django migration?").exists())
+        self.assertFalse(BankQuestion.objects.filter(question="Missing options").exists())
+
+
+@mock.patch("ai.ai_logic.QUIZ_GENERATION_MODE", "sharded")
+class ShardedGenerationTests(SimpleTestCase):
+    COUNTS = {'easy': 2, 'intermediate': 0, 'advanced': 1}
+
+    def _reply(self, prompt, **kwargs):
+        """One shard's reply: the difficulty the prompt asks for, as JSON."""
+        n, difficulty = re.search(r"Include (\d+) (\w+) questions", prompt).groups()
+        self.asked.append((difficulty, kwargs['max_tokens']))
+        if difficulty in self.failing:
+            raise LLMError("shard failed")
+        stems = self.stems[difficulty]
+        return json.dumps([{"question": stem, "options": ["1", "2", "3", "4"], "answer": "1",
+                            "difficulty": difficulty} for stem in stems[:int(n)]])
+
+    def setUp(self):
+        self.asked, self.failing = [], set()
+        self.stems = {'easy': ["What is Git?", "What is a branch?", "What is Git?"],
+                      'advanced': ["What is a branch?", "How does git rebase rewrite history?"]}
+        self.client = mock.Mock(chat=mock.Mock(side_effect=self._reply))
+
+    def test_one_call_per_requested_difficulty(self):
+        self.assertEqual(_shards(self.COUNTS), [{'easy': 2}, {'advanced': 1}])
+
+        questions = _generate_first_pass(self.client, "CV", 'en', self.COUNTS, fresh=False)
+
+        self.assertEqual(sorted(d for d, _ in self.asked), ['advanced', 'easy'])
+        self.assertEqual(dict(self.asked), {'easy': 600, 'advanced': 600})
+        self.assertEqual(len(questions), 3)
+
+    def test_merged_shards_are_deduplicated(self):
+        questions = _generate_first_pass(self.client, "CV", 'en', self.COUNTS, fresh=False)
+
+        accepted, missing = _accept_questions(questions, self.COUNTS)
+
+        # Shards merge in difficulty order, so the advanced shard's repeat of an easy question is dropped
+        self.assertEqual([q['question'] for q in accepted], ["What is Git?", "What is a branch?"])
+        self.assertEqual(missing, {'advanced': 1})
+
+    def test_failed_shard_leaves_only_its_questions_missing(self):
+        self.failing.add('advanced')
+
+        questions = _generate_first_pass(self.client, "CV", 'en', self.COUNTS, fresh=False)
+
+        self.assertEqual([q['difficulty'] for q in questions], ['easy', 'easy'])
+        self.assertEqual(_accept_questions(questions, self.COUNTS)[1], {'advanced': 1})
+
+
+class DetectLanguageTests(SimpleTestCase):
+    def test_clear_scripts_are_decided_without_langdetect(self):
+        with mock.patch("ai.ai_logic._langdetect") as langdetect:
+            arabic = detect_language_details("مهندس برمجيات أول، خبرة في بايثون وجانغو Python")
+            english = detect_language_details("Senior software engineer, Python and Django. خبرة")
+
+        langdetect.assert_not_called()
+        self.assertEqual((arabic['language'], arabic['method']), ('ar', 'script'))
+        self.assertGreaterEqual(arabic['confidence'], 0.65)
+        self.assertEqual((english['language'], english['method']), ('en', 'script'))
+
+    def test_presentation_forms_count_as_arabic(self):
+        self.assertEqual(detect_language_details("ﻣﺮﺣﺒﺎ ﺑﻜﻢ")['language'], 'ar')
+
+    def test_mixed_scripts_go_to_langdetect(self):
+        mixed = "Python Django REST APIs مطور برمجيات خبرة"
+        best = mock.Mock(lang='ar', prob=0.8)
+
+        with mock.patch("ai.ai_logic._langdetect", return_value=lambda sample: [best]):
+            result = detect_language_details(mixed)
+
+        self.assertEqual((result['language'], result['method'], result['confidence']), ('ar', 'langdetect', 0.8))
+
+    def test_langdetect_failure_falls_back_to_the_majority_script(self):
+        def broken(sample):
+            raise ValueError("no features")
+
+        with mock.patch("ai.ai_logic._langdetect", return_value=broken):
+            result = detect_language_details("Python Django REST APIs مطور برمجيات خبرة")
+
+        self.assertEqual((result['language'], result['method']), ('en', 'script'))
+
+    def test_no_letters_defaults_to_english(self):
+        self.assertEqual(detect_language_details("+966 55 123 4567 — 2019-2024")['method'], 'default')
+
+
+class ExtractDocxTests(SimpleTestCase):
+    W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+    def _docx(self, body, pages=None):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("word/document.xml", f'<w:document xmlns:w="{self.W}"><w:body>{body}</w:body></w:document>')
+            if pages is not None:
+                archive.writestr("docProps/app.xml", "<Properties xmlns='http://schemas.openxmlformats.org/"
+                                                     f"officeDocument/2006/extended-properties'><Pages>{pages}</Pages>"
+                                                     "</Properties>")
+        return io.BytesIO(buffer.getvalue())
+
+    def test_runs_tabs_and_breaks_become_paragraph_text(self):
+        body = ('<w:p><w:r><w:t>Layla </w:t></w:r><w:r><w:t>Hassan</w:t></w:r></w:p>'
+                '<w:p><w:r><w:t>Python</w:t><w:tab/><w:t>5 years</w:t><w:br/><w:t>Django</w:t></w:r></w:p>')
+
+        result = extract_document(self._docx(body, pages=2))
+
+        self.assertEqual(result['text'], "Layla Hassan\nPython\t5 years\nDjango\n")
+        self.assertEqual((result['method'], result['page_count'], result['truncated']), ("docx", 2, False))
+
+    def test_stops_reading_once_the_budget_is_met(self):
+        body = "".join(f"<w:p><w:r><w:t>Project {i}: payments API</w:t></w:r></w:p>" for i in range(5000))
+        seen = []
+        real_iter = ai_logic._iter_docx_paragraphs
+
+        def counting(source):
+            for paragraph in real_iter(source):
+                seen.append(paragraph)
+                yield paragraph
+
+        with mock.patch("ai.ai_logic._iter_docx_paragraphs", side_effect=counting):
+            result = extract_docx(self._docx(body), max_chars=200)
+
+        self.assertEqual(len(result['text']), 200)
+        self.assertTrue(result['truncated'])
+        self.assertLess(len(seen), 20)
+        self.assertEqual(result['page_count'], 0)
+
+
+class PregenerationTests(TestCase):
+    QUIZ = [{"question": "What is Docker?", "options": ["1", "2", "3", "4"], "answer": "1"}]
+
+    def setUp(self):
+        user = User.objects.create_user("applicant")
+        self.cv = CV.objects.create(user=user, title="CV", file="cvs/applicant.pdf", detected_language='en')
+
+    def _entry(self, status, language='en', expires_in=timedelta(hours=1)):
+        return PregeneratedQuiz.objects.create(cv=self.cv, language=language, status=status,
+                                               questions=self.QUIZ, expires_at=timezone.now() + expires_in)
+
+    async def test_ready_quiz_is_taken_once(self):
+        entry = await sync_to_async(self._entry)('ready')
+
+        self.assertEqual(await atake_pregenerated_quiz(self.cv, 'en'), self.QUIZ)
+        self.assertIsNone(await atake_pregenerated_quiz(self.cv, 'en'))
+        await entry.arefresh_from_db()
+        self.assertEqual(entry.status, 'consumed')
+
+    async def test_only_a_ready_unexpired_quiz_in_the_language_is_taken(self):
+        entry = await sync_to_async(self._entry)('ready', language='ar')
+        self.assertIsNone(await atake_pregenerated_quiz(self.cv, 'en'))
+
+        await PregeneratedQuiz.objects.filter(pk=entry.pk).aupdate(language='en', status='pending')
+        self.assertIsNone(await atake_pregenerated_quiz(self.cv, 'en'))
+
+        await PregeneratedQuiz.objects.filter(pk=entry.pk).aupdate(
+            status='ready', expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(await atake_pregenerated_quiz(self.cv, 'en'))
+
+    @mock.patch("ai.pregeneration.connections")
+    @mock.patch("ai.text_cache.get_cv_text", return_value={'text': "Docker, Kubernetes"})
+    def test_cancelled_entry_is_not_generated(self, get_cv_text, connections):
+        entry = self._entry('pending')
+        async_to_sync(acancel_pregeneration)(self.cv.id)
+
+        with mock.patch("ai.question_bank.build_quiz") as build_quiz:
+            _pregenerate(entry.id)
+
+        build_quiz.assert_not_called()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'cancelled')
+
+    @mock.patch("ai.pregeneration.connections")
+    @mock.patch("ai.text_cache.get_cv_text", return_value={'text': "Docker, Kubernetes"})
+    def test_cancel_during_generation_discards_the_quiz(self, get_cv_text, connections):
+        entry = self._entry('pending')
+        entry.questions = []
+        entry.save()
+
+        def build_quiz(*args, **kwargs):
+            async_to_sync(acancel_pregeneration)(self.cv.id)
+            return self.QUIZ
+
+        with mock.patch("ai.question_bank.build_quiz", side_effect=build_quiz):
+            _pregenerate(entry.id)
+
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.questions), ('cancelled', []))
+
+    @mock.patch("ai.pregeneration.connections")
+    @mock.patch("ai.text_cache.get_cv_text", return_value={'text': "Docker, Kubernetes"})
+    def test_pending_entry_becomes_ready(self, get_cv_text, connections):
+        entry = self._entry('pending')
+
+        with mock.patch("ai.question_bank.build_quiz", return_value=self.QUIZ) as build_quiz:
+            _pregenerate(entry.id)
+
+        build_quiz.assert_called_once_with("Docker, Kubernetes", language='en', job_titles=[])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'ready')
@@ -0,0 +1,86 @@
+"""
+Content-addressed cache of extracted CV text
+Each distinct file is parsed (and OCR'd) once; quiz generation, interview
+questions and re-uploads of the same bytes reuse the stored result
+"""
+import logging
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+
+from .ai_logic import CV_TEXT_BUDGET, detect_language_details, extract_document, file_sha256
+from .models import ExtractedText
+
+logger = logging.getLogger(__name__)
+
+
+def _as_dict(entry: ExtractedText, max_chars: Optional[int]) -> dict:
+    return {
+        'sha256': entry.sha256,
+        'text': entry.text[:max_chars] if max_chars else entry.text,
+        'page_count': entry.page_count,
+        'method': entry.extraction_method,
+        'language': entry.detected_language,
+    }
+
+
+def _cached(sha256: str, max_chars: Optional[int]) -> Optional[ExtractedText]:
+    entry = ExtractedText.objects.filter(sha256=sha256).first()
+    if entry and (not entry.truncated or (max_chars and len(entry.text) >= max_chars)):
+        logger.info(f"Extracted text cache hit for {sha256[:12]}")
+        return entry
+    return None
+
+
+def _extract(file, sha256: str, max_chars: Optional[int]) -> dict:
+    extracted = extract_document(file, max_chars)
+    detection = detect_language_details(extracted['text'])
+    logger.info(
+        f"Detected language {detection['language']} for {sha256[:12]} "
+        f"({detection['method']}, confidence {detection['confidence']}, {detection['elapsed_ms']} ms)"
+    )
+    return {
+        'text': extracted['text'],
+        'page_count': extracted['page_count'],
+        'extraction_method': extracted['method'],
+        'detected_language': detection['language'],
+        'truncated': extracted['truncated'],
+    }
+
+
+def _store(sha256: str, defaults: dict) -> ExtractedText:
+    try:
+        entry, _ = ExtractedText.objects.update_or_create(sha256=sha256, defaults=defaults)
+    except IntegrityError:
+        # Another request extracted the same file concurrently
+        entry = ExtractedText.objects.get(sha256=sha256)
+
+    logger.info(f"Extracted text cached for {sha256[:12]} ({entry.extraction_method}, {entry.page_count} pages)")
+    return entry
+
+
+def get_cv_text(file, max_chars: Optional[int] = CV_TEXT_BUDGET) -> dict:
+    """
+    Return extracted text, page count, extraction method and language for a CV file.
+    Extraction only runs when no cached entry covers the requested budget.
+    """
+    sha256 = file_sha256(file)
+    entry = _cached(sha256, max_chars)
+    if entry is None:
+        entry = _store(sha256, _extract(file, sha256, max_chars))
+    return _as_dict(entry, max_chars)
+
+
+async def aget_cv_text(file, max_chars: Optional[int] = CV_TEXT_BUDGET) -> dict:
+    """
+    Async version of get_cv_text, for async views.
+    Hashing and extraction (OCR included) run in their own threads; only the ORM
+    calls go through the thread-sensitive executor that sync views share.
+    """
+    sha256 = await sync_to_async(file_sha256, thread_sensitive=False)(file)
+    entry = await sync_to_async(_cached)(sha256, max_chars)
+    if entry is None:
+        defaults = await sync_to_async(_extract, thread_sensitive=False)(file, sha256, max_chars)
+        entry = await sync_to_async(_store)(sha256, defaults)
+    return _as_dict(entry, max_chars)
@@ -2,12 +2,16 @@
 from django.urls import path
 from .views import (
     generate_questions_view,
+    generate_questions_stream_view,
     submit_answers_view,
+    feedback_stream_view,
 )
 
 urlpatterns = [
     path("generate/", generate_questions_view, name="ai-generate"),
+    path("generate/stream/", generate_questions_stream_view, name="ai-generate-stream"),
     path("submit/", submit_answers_view, name="ai-submit"),
+    path("feedback/<int:result_id>/stream/", feedback_stream_view, name="ai-feedback-stream"),
     # path("interview/start/", start_voice_interview, name="interview-start"),
     # path("interview/submit/", submit_voice_interview, name="interview-submit"),
     # path("report/pdf/", generate_pdf_report, name="generate-pdf"),
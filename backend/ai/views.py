@@ -1,133 +1,158 @@
 # backend/ai/views.py
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from cv.models import CV
-from quiz.models import Quiz, Question, Result
-from feedback.models import Feedback
-from .ai_logic import extract_text_from_pdf, generate_questions_from_cv, detect_cv_language, generate_feedback_from_ai
+from quiz.models import Quiz, Question
+from .ai_logic import astream_feedback_from_ai, astream_questions_from_cv
+from .pregeneration import acancel_pregeneration, atake_pregenerated_quiz
+from .question_bank import abuild_quiz, finish_quiz, plan_quiz
+from .singleflight import get_single_flight
+from .text_cache import aget_cv_text
 import json
 import logging
 from core.supabase_client import (
     save_quiz_to_supabase,
     save_questions_to_supabase,
     save_result_to_supabase,
-    get_quiz_questions
+    save_feedback_to_supabase,
+    get_quiz_by_id,
+    get_quiz_questions,
+    get_result_by_id,
+    get_result_feedback
 )
 
 logger = logging.getLogger(__name__)
 
+# Views are async so a worker is not tied up while Groq answers. ORM work runs on
+# the thread-sensitive executor that sync views share; extraction and Supabase
+# HTTP calls get their own threads (thread_sensitive=False) so a slow upload in
+# the same worker doesn't hold them up
 @csrf_exempt
-def generate_questions_view(request):
+async def generate_questions_view(request):
     """
     POST:
       JSON:  { "cv_id": <int> }               -> uses a server-stored CV file
       OR multipart/form-data with file under one of:
               'cv' | 'file' | 'pdf' | 'cv_file' | 'resume' | 'document'
+      Optional "fresh": true generates a new quiz instead of reusing the cached one
     RESP: { "questions": [ {question, options?, answer?}, ... ], "quiz_id": <int> }
     """
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request method."}, status=400)
 
-    cv_file = None
-    cv_obj = None
+    source = await _quiz_source(request)
+    if isinstance(source, JsonResponse):
+        return source
+    cv_file, cv_obj, fresh = source
 
-    # Try JSON body with cv_id
+    # Extract text & generate questions
     try:
-        if request.content_type and "application/json" in request.content_type:
-            body = request.body.decode("utf-8") or "{}"
-            data = json.loads(body)
-            cv_id = data.get("cv_id")
-            if cv_id is not None:
+        text, language, sha256 = await _cv_text_and_language(cv_file, cv_obj)
+        user = await request.auser()
+
+        async def generate():
+            questions_data = await _pregenerated_or_new_questions(cv_obj, text, language, fresh)
+            questions = _normalize_questions(questions_data)
+            logger.info(f"Generated {len(questions)} questions")
+
+            response = {"questions": questions, "language": language}
+            if user.is_authenticated:
                 try:
-                    cv_obj = CV.objects.get(pk=cv_id)
-                    cv_file = cv_obj.file  # FileField
-                    logger.info(f"Using CV ID: {cv_id}")
-                except CV.DoesNotExist:
-                    return JsonResponse({"error": "CV not found."}, status=404)
+                    quiz_id, saved_cv = await _save_quiz(user, cv_obj, cv_file, questions)
+                    response.update(quiz_id=quiz_id, cv_id=saved_cv.id if saved_cv else None)
+                except Exception as e:
+                    logger.error(f"Error saving quiz to Supabase: {e}", exc_info=True)
+                    response["error"] = "Quiz saved with errors"
+            return response
+
+        # A double-click or client retry for the same CV joins the request already in
+        # flight (in any worker) instead of paying for another Groq call and quiz row.
+        # A "fresh" request only joins another fresh one, never a cached/pre-generated quiz
+        operation = f"generate:{user.id}" if user.is_authenticated else "generate"
+        response = await get_single_flight().ado((sha256, language, operation, fresh), generate)
+        return JsonResponse(response, status=200)
     except Exception as e:
-        logger.error(f"Error parsing JSON: {e}")
-        pass
+        logger.error(f"Error generating questions: {e}", exc_info=True)
+        return JsonResponse({"error": f"Failed to generate questions: {str(e)}"}, status=500)
 
-    # Try multipart with a file under common keys
-    if cv_file is None:
-        for key in ["cv", "file", "pdf", "cv_file", "resume", "document"]:
-            if key in request.FILES:
-                cv_file = request.FILES[key]
-                logger.info(f"Using uploaded file from key: {key}")
-                break
 
-        if not cv_file:
-            return JsonResponse({"error": "Please upload a valid PDF file or provide cv_id."}, status=400)
+@csrf_exempt
+async def generate_questions_stream_view(request):
+    """
+    POST /api/ai/generate/stream/ (same body as /api/ai/generate/)
+    Server-Sent Events:
+      event: meta      data: {"language": ...}
+      event: question  data: {"index": <int>, "question": {question, options, answer}}   (one per question)
+      event: done      data: {"total": <int>, "quiz_id": <int|null>, "cv_id": <int|null>}
+      event: error     data: {"error": ...}
+    Each question is sent as soon as its JSON object is complete in the model output.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=400)
 
-    # Extract text & generate questions
-    try:
-        text = extract_text_from_pdf(cv_file)
-        logger.info(f"Extracted text length: {len(text)}")
+    source = await _quiz_source(request)
+    if isinstance(source, JsonResponse):
+        return source
+    cv_file, cv_obj, fresh = source
+    user = await request.auser()
 
-        # Detect language for quiz generation
-        language = 'en'  # default
+    async def events():
+        questions = []
         try:
-            if cv_obj:
-                language = cv_obj.detected_language or 'en'
+            text, language, _ = await _cv_text_and_language(cv_file, cv_obj)
+            yield _sse("meta", {"language": language})
+
+            pregenerated = await atake_pregenerated_quiz(cv_obj, language) if cv_obj and not fresh else None
+            if pregenerated:
+                logger.info(f"Serving pre-generated quiz for CV {cv_obj.id}")
+                picked, stream = _normalize_questions(pregenerated), _aiter([])
             else:
-                language = detect_cv_language(text)
-            logger.info(f"Detected language: {language}")
-        except Exception as e:
-            logger.error(f"Language detection error: {e}")
-            language = 'en'
+                if cv_obj and fresh:
+                    await acancel_pregeneration(cv_obj.id)
+                # Questions from the bank go out first; Groq streams only the rest
+                job_titles = _job_titles(cv_obj)
+                picked, gaps = await sync_to_async(plan_quiz)(text, language, job_titles, fresh)
+                stream = astream_questions_from_cv(text, language=language, fresh=fresh, counts=gaps) \
+                    if gaps is None or gaps else _aiter([])
 
-        questions_data = generate_questions_from_cv(text, language=language)
-        questions = _normalize_questions(questions_data)
-        logger.info(f"Generated {len(questions)} questions")
+            for question in picked:
+                questions.append(question)
+                yield _sse("question", {"index": len(questions) - 1, "question": question})
+            generated = []
+            async for question in stream:
+                generated.append(question)
+                questions.append(question)
+                yield _sse("question", {"index": len(questions) - 1, "question": question})
+            if generated:
+                await sync_to_async(finish_quiz)([], generated, language, _job_titles(cv_obj))
+            logger.info(f"Streamed {len(questions)} questions ({len(picked)} without generation)")
+        except Exception as e:
+            logger.error(f"Error streaming questions: {e}", exc_info=True)
+            yield _sse("error", {"error": f"Failed to generate questions: {str(e)}"})
+            return
 
-        if request.user.is_authenticated:
+        done = {"total": len(questions), "quiz_id": None, "cv_id": cv_obj.id if cv_obj else None}
+        if user.is_authenticated and questions:
             try:
-                # Use existing CV or create a temporary one
-                if not cv_obj and cv_file:
-                    cv_obj = CV.objects.create(
-                        user=request.user,
-                        title="Quick Quiz CV",
-                        file=cv_file
-                    )
-                
-                # Save quiz to Supabase
-                quiz_data = save_quiz_to_supabase(
-                    user_id=request.user.id,
-                    title=f"Quiz for {cv_obj.title if cv_obj else 'CV'}",
-                    cv_id=cv_obj.id if cv_obj else None
-                )
-                quiz_id = quiz_data['id']
-                logger.info(f"[v0] Created quiz in Supabase with ID: {quiz_id}")
-                
-                # Save questions to Supabase
-                save_questions_to_supabase(quiz_id, questions)
-                
-                return JsonResponse({
-                    "questions": questions,
-                    "language": language,
-                    "quiz_id": quiz_id,
-                    "cv_id": cv_obj.id if cv_obj else None
-                }, status=200)
+                done["quiz_id"], saved_cv = await _save_quiz(user, cv_obj, cv_file, questions)
+                done["cv_id"] = saved_cv.id if saved_cv else None
             except Exception as e:
                 logger.error(f"Error saving quiz to Supabase: {e}", exc_info=True)
-                return JsonResponse({
-                    "questions": questions,
-                    "language": language,
-                    "error": "Quiz saved with errors"
-                }, status=200)
-        
-        return JsonResponse({"questions": questions, "language": language}, status=200)
-    except Exception as e:
-        logger.error(f"Error generating questions: {e}", exc_info=True)
-        return JsonResponse({"error": f"Failed to generate questions: {str(e)}"}, status=500)
+                done["error"] = "Quiz saved with errors"
+        yield _sse("done", done)
+
+    return _sse_response(events())
 
 
 @csrf_exempt
-def submit_answers_view(request):
+async def submit_answers_view(request):
     """
     POST /api/ai/submit/
     Body: { "quiz_id": <int>, "cv_id": <int>, "answers": [...] }
-    Responds with score, result_id, quiz_id, and feedback
+    Responds with score, result_id, quiz_id and the graded answers right away;
+    feedback_stream is the SSE URL the AI feedback for this result streams from
     """
     logger.critical("=" * 80)
     logger.critical("[v0] SUBMIT_ANSWERS_VIEW CALLED - REQUEST RECEIVED")
@@ -156,14 +181,14 @@ def submit_answers_view(request):
         
         if cv_id:
             try:
-                cv_obj = CV.objects.get(id=cv_id)
+                cv_obj = await CV.objects.aget(id=cv_id)
                 logger.info(f"[v0] Found CV: {cv_obj.id} - {cv_obj.title}")
             except CV.DoesNotExist:
                 logger.warning(f"[v0] CV {cv_id} not found")
         
         if quiz_id:
             try:
-                questions = get_quiz_questions(quiz_id)
+                questions = await sync_to_async(get_quiz_questions, thread_sensitive=False)(quiz_id)
                 logger.info(f"[v0] Found {len(questions)} questions from Supabase")
                 
                 # Mark each answer as correct or incorrect
@@ -199,39 +224,25 @@ def submit_answers_view(request):
         score = round((correct_count / total_questions * 100)) if total_questions > 0 else 0
         logger.info(f"[v0] CALCULATED SCORE: {score}% ({correct_count}/{total_questions} correct)")
 
-        result_obj = None
         feedback_text = ""
+        feedback_stream = None
         
-        if request.user.is_authenticated and quiz_id:
+        user = await request.auser()
+        if user.is_authenticated and quiz_id:
             try:
-                result_data = save_result_to_supabase(
+                result_data = await sync_to_async(save_result_to_supabase, thread_sensitive=False)(
                     quiz_id=quiz_id,
-                    user_id=request.user.id,
+                    user_id=user.id,
                     score=score,
                     answers=answers
                 )
                 result_id = result_data['id']
                 logger.critical(f"[v0] ✓ CREATED RESULT IN SUPABASE WITH ID: {result_id}")
-                
-                # Generate AI feedback
-                wrong_answers = [ans for ans in answers if not ans.get('isCorrect')]
-                feedback_text = generate_feedback_from_ai(wrong_answers, score)
-                logger.info(f"[v0] Generated feedback: {len(feedback_text)} chars")
-                
-                # Save feedback using Django ORM (only for feedback table)
+
+                # AI feedback is generated by the stream endpoint, so the score isn't held back by it
+                feedback_stream = reverse("ai-feedback-stream", args=[result_id])
                 if cv_obj:
-                    try:
-                        result_obj = Result.objects.get(id=result_id)
-                        Feedback.objects.create(
-                            user=request.user,
-                            cv=cv_obj,
-                            result=result_obj,
-                            content=feedback_text,
-                            rating=5 if score >= 80 else 4 if score >= 70 else 3
-                        )
-                        logger.info(f"[v0] ✓ Created feedback for result {result_id}")
-                    except Exception as e:
-                        logger.error(f"[v0] Error saving feedback: {e}")
+                    feedback_stream += f"?cv_id={cv_obj.id}"
                 
             except Exception as e:
                 logger.critical(f"[v0] ✗ Error saving result to Supabase: {e}", exc_info=True)
@@ -242,6 +253,7 @@ def submit_answers_view(request):
             "result_id": result_id if 'result_id' in locals() else None,
             "quiz_id": quiz_id,
             "feedback": feedback_text,
+            "feedback_stream": feedback_stream,
             "correct": correct_count,
             "total": total_questions,
             "answers": answers
@@ -260,9 +272,249 @@ def submit_answers_view(request):
         logger.critical(f"[v0] ✗ FATAL ERROR submitting answers: {e}", exc_info=True)
         return JsonResponse({"error": f"Failed to submit answers: {str(e)}"}, status=500)
 
+@csrf_exempt
+async def feedback_stream_view(request, result_id):
+    """
+    GET /api/ai/feedback/<result_id>/stream/[?cv_id=<int>]
+    Server-Sent Events:
+      event: chunk  data: {"text": ...}   (feedback text as it is generated)
+      event: done   data: {"feedback_id": <int|null>}   (null when the feedback was not saved)
+      event: error  data: {"error": ...}
+    The result is read from Supabase, where submit saved it, and the feedback is saved
+    there once the text is complete (with cv_id or the quiz's CV).
+    Feedback that already exists is replayed as a single chunk.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request method."}, status=400)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required."}, status=401)
+    try:
+        result_data = await sync_to_async(get_result_by_id, thread_sensitive=False)(result_id)
+    except Exception as e:
+        logger.error(f"[v0] Error getting result {result_id} from Supabase: {e}")
+        return JsonResponse({"error": "Could not load the result."}, status=502)
+    if not result_data or result_data.get("user_id") != user.id:
+        return JsonResponse({"error": "Result not found."}, status=404)
+
+    quiz_id = result_data.get("quiz_id")
+    try:
+        existing = await sync_to_async(get_result_feedback, thread_sensitive=False)(result_id)
+    except Exception as e:
+        logger.warning(f"[v0] Could not check existing feedback for result {result_id}: {e}")
+        existing = None
+    requested_cv = request.GET.get("cv_id", "")
+
+    async def events():
+        if existing:
+            yield _sse("chunk", {"text": existing.get("content", "")})
+            yield _sse("done", {"feedback_id": existing.get("id")})
+            return
+
+        answers = result_data.get("answers")
+        answers = answers if isinstance(answers, list) else []
+        score = result_data.get("score") or 0
+        try:
+            questions = await sync_to_async(get_quiz_questions, thread_sensitive=False)(quiz_id)
+        except Exception as e:
+            # Without the question texts the feedback would be written blind
+            logger.error(f"[v0] Error getting questions for result {result_id}: {e}")
+            yield _sse("error", {"error": "Could not load the quiz questions for feedback."})
+            return
+        wrong_answers = _wrong_answers(answers, questions)
+        parts = []
+        try:
+            async for chunk in astream_feedback_from_ai(wrong_answers, score):
+                parts.append(chunk)
+                yield _sse("chunk", {"text": chunk})
+        except Exception as e:
+            logger.error(f"[v0] Error streaming feedback for result {result_id}: {e}", exc_info=True)
+            yield _sse("error", {"error": f"Error while generating feedback: {str(e)}"})
+            return
+
+        feedback_text = "".join(parts)
+        logger.info(f"[v0] Generated feedback: {len(feedback_text)} chars")
+        feedback_id = None
+        try:
+            cv_id = await _feedback_cv_id(user, quiz_id, requested_cv)
+            if cv_id is None:
+                # feedback_feedback.cv_id is NOT NULL
+                logger.warning(f"[v0] No CV for result {result_id}; feedback not saved")
+            else:
+                feedback = await sync_to_async(save_feedback_to_supabase, thread_sensitive=False)(
+                    user_id=user.id,
+                    cv_id=cv_id,
+                    result_id=result_id,
+                    content=feedback_text,
+                    rating=5 if score >= 80 else 4 if score >= 70 else 3
+                )
+                feedback_id = feedback['id'] if feedback else None
+                logger.info(f"[v0] ✓ Created feedback for result {result_id}")
+        except Exception as e:
+            # The text has already been streamed; only replaying it later is lost
+            logger.error(f"[v0] Error saving feedback: {e}")
+        yield _sse("done", {"feedback_id": feedback_id})
+
+    return _sse_response(events())
+
+
 # -----------------
 # Helpers
 # -----------------
+async def _quiz_source(request):
+    """
+    Resolve the CV a quiz request refers to.
+    Returns (cv_file, cv_obj, fresh) or a JsonResponse error.
+    """
+    cv_file = None
+    cv_obj = None
+    # Skip the cached quiz for this CV and ask the model for a new one
+    fresh = request.POST.get("fresh") in ("1", "true")
+
+    # Try JSON body with cv_id
+    try:
+        if request.content_type and "application/json" in request.content_type:
+            body = request.body.decode("utf-8") or "{}"
+            data = json.loads(body)
+            if "fresh" in data:
+                fresh = data["fresh"] is True or str(data["fresh"]).lower() in ("1", "true")
+            cv_id = data.get("cv_id")
+            if cv_id is not None:
+                try:
+                    cv_obj = await CV.objects.aget(pk=cv_id)
+                    cv_file = cv_obj.file  # FileField
+                    logger.info(f"Using CV ID: {cv_id}")
+                except CV.DoesNotExist:
+                    return JsonResponse({"error": "CV not found."}, status=404)
+    except Exception as e:
+        logger.error(f"Error parsing JSON: {e}")
+        pass
+
+    # Try multipart with a file under common keys
+    if cv_file is None:
+        for key in ["cv", "file", "pdf", "cv_file", "resume", "document"]:
+            if key in request.FILES:
+                cv_file = request.FILES[key]
+                logger.info(f"Using uploaded file from key: {key}")
+                break
+
+        if not cv_file:
+            return JsonResponse({"error": "Please upload a valid PDF or DOCX file or provide cv_id."}, status=400)
+
+    return cv_file, cv_obj, fresh
+
+
+async def _cv_text_and_language(cv_file, cv_obj):
+    """Returns (text, language, sha256) for the CV file."""
+    # Extracted text and language are cached by file hash, so a stored CV is never re-parsed
+    extracted = await aget_cv_text(cv_file)
+    text = extracted['text']
+    logger.info(f"Extracted text length: {len(text)} ({extracted['method']})")
+
+    # Detect language for quiz generation
+    if cv_obj:
+        language = cv_obj.detected_language or extracted['language']
+    else:
+        language = extracted['language']
+    logger.info(f"Detected language: {language}")
+    return text, language, extracted['sha256']
+
+
+async def _save_quiz(user, cv_obj, cv_file, questions):
+    """Store the quiz and its questions in Supabase. Returns (quiz_id, cv_obj)."""
+    # Use existing CV or create a temporary one
+    if not cv_obj and cv_file:
+        cv_obj = await CV.objects.acreate(
+            user=user,
+            title="Quick Quiz CV",
+            file=cv_file
+        )
+
+    # Save quiz to Supabase
+    quiz_data = await sync_to_async(save_quiz_to_supabase, thread_sensitive=False)(
+        user_id=user.id,
+        title=f"Quiz for {cv_obj.title if cv_obj else 'CV'}",
+        cv_id=cv_obj.id if cv_obj else None
+    )
+    quiz_id = quiz_data['id']
+    logger.info(f"[v0] Created quiz in Supabase with ID: {quiz_id}")
+
+    # Save questions to Supabase
+    await sync_to_async(save_questions_to_supabase, thread_sensitive=False)(quiz_id, questions)
+    return quiz_id, cv_obj
+
+
+async def _pregenerated_or_new_questions(cv_obj, text, language, fresh):
+    """Questions pre-generated at upload if ready, otherwise a quiz from the bank plus Groq for the rest."""
+    if cv_obj and not fresh:
+        pregenerated = await atake_pregenerated_quiz(cv_obj, language)
+        if pregenerated:
+            logger.info(f"Serving pre-generated quiz for CV {cv_obj.id}")
+            return pregenerated
+    if cv_obj and fresh:
+        # The user asked for a new quiz; the speculative one is no longer wanted
+        await acancel_pregeneration(cv_obj.id)
+    return await abuild_quiz(text, language=language, job_titles=_job_titles(cv_obj), fresh=fresh)
+
+
+def _wrong_answers(answers, questions):
+    """
+    The incorrect answers of a result as {question, chosen, correct} texts.
+    Results only store option indices, so they are looked up in the quiz's questions
+    (answer i belongs to question i).
+    """
+    wrong = []
+    for i, ans in enumerate(answers):
+        if not isinstance(ans, dict) or ans.get('isCorrect'):
+            continue
+        question = questions[i] if i < len(questions) else {}
+        options = question.get('options') or []
+
+        def option(index):
+            try:
+                index = int(index)
+            except (TypeError, ValueError):
+                return str(index or "")
+            return options[index] if 0 <= index < len(options) else ""
+
+        wrong.append({
+            'question': question.get('text', ''),
+            'chosen': option(ans.get('answer')),
+            'correct': option(question.get('correct_answer', ans.get('correctAnswer'))),
+        })
+    return wrong
+
+
+async def _feedback_cv_id(user, quiz_id, requested_cv):
+    """The CV feedback is filed under: the requested one if it is the user's, else the quiz's."""
+    if requested_cv.isdigit() and await CV.objects.filter(pk=requested_cv, user=user).aexists():
+        return int(requested_cv)
+    quiz = await sync_to_async(get_quiz_by_id, thread_sensitive=False)(quiz_id) if quiz_id else None
+    return quiz.get("cv_id") if quiz else None
+
+
+def _job_titles(cv_obj):
+    return (cv_obj.extracted_job_titles or []) if cv_obj else []
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 def _normalize_questions(raw):
     """
     Accepts:
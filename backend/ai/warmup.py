@@ -0,0 +1,56 @@
+"""
+Pre-fork warmup for the AI pipeline
+ai_logic loads its heavy dependencies lazily. Calling warmup() in the gunicorn
+master (see gunicorn.conf.py) loads them once before the workers fork, so every
+worker shares them copy-on-write instead of paying for them on its first request
+"""
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+HEAVY_MODULES = [
+    "PyPDF2",
+    "pdf2image",
+    "pytesseract",
+    "langdetect",
+    "reportlab.lib.styles",
+    "reportlab.platypus",
+    "ai.ai_logic",
+    "ai.ocr",
+    "ai.llm_client",
+    "ai.text_cache",
+]
+
+
+def warmup() -> None:
+    """Import the heavy AI dependencies and load langdetect's language profiles."""
+    started = time.perf_counter()
+
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Warmup could not import {name}: {e}")
+
+    try:
+        from langdetect.detector_factory import init_factory
+        from ai.ai_logic import _langdetect
+
+        init_factory()
+        _langdetect()
+    except Exception as e:
+        logger.warning(f"Warmup could not load langdetect profiles: {e}")
+
+    logger.info(f"AI warmup finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def post_fork() -> None:
+    """
+    Per-worker reset right after fork: database connections opened in the master
+    must not be shared between processes.
+    """
+    from django.db import connections
+
+    connections.close_all()
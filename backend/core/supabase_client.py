@@ -46,6 +46,16 @@ def save_quiz_to_supabase(user_id: int, title: str, cv_id: Optional[int] = None)
     return result.data[0] if result.data else None
 
 
+def _answer_index(question: dict) -> int:
+    """Index of the correct option; generated questions name the answer by its text."""
+    index = question.get('correctAnswer')
+    if isinstance(index, int):
+        return index
+    options = question.get('options') or []
+    answer = question.get('answer')
+    return options.index(answer) if answer in options else 0
+
+
 def save_questions_to_supabase(quiz_id: int, questions: list) -> list:
     """Save questions to Supabase and return created records"""
     client = get_supabase_client()
@@ -56,7 +66,7 @@ def save_questions_to_supabase(quiz_id: int, questions: list) -> list:
             "quiz_id": quiz_id,
             "text": q.get('question', ''),
             "options": q.get('options', []),
-            "correct_answer": q.get('correctAnswer', 0)
+            "correct_answer": _answer_index(q)
         })
     
     result = client.table('quiz_question').insert(questions_data).execute()
@@ -102,3 +112,36 @@ def get_user_results(user_id: int) -> list:
     
     result = client.table('quiz_result').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
     return result.data
+
+
+def get_quiz_by_id(quiz_id: int) -> Optional[dict]:
+    """Get a quiz by ID from Supabase"""
+    client = get_supabase_client()
+    
+    result = client.table('quiz_quiz').select('*').eq('id', quiz_id).execute()
+    return result.data[0] if result.data else None
+
+
+def save_feedback_to_supabase(user_id: int, cv_id: Optional[int], result_id: int, content: str, rating: int) -> dict:
+    """Save AI feedback for a result to Supabase and return the created record"""
+    client = get_supabase_client()
+    
+    data = {
+        "user_id": user_id,
+        "cv_id": cv_id,
+        "result_id": result_id,
+        "content": content,
+        "rating": rating
+    }
+    
+    result = client.table('feedback_feedback').insert(data).execute()
+    logger.info(f"[v0] Created feedback in Supabase for result {result_id}")
+    return result.data[0] if result.data else None
+
+
+def get_result_feedback(result_id: int) -> Optional[dict]:
+    """Get the feedback saved for a result from Supabase"""
+    client = get_supabase_client()
+    
+    result = client.table('feedback_feedback').select('*').eq('result_id', result_id).execute()
+    return result.data[0] if result.data else None
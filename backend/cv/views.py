@@ -5,9 +5,16 @@ from .models import CV
 from .serializers import CVSerializer
 from rest_framework.permissions import IsAuthenticated
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# Overall budget for the post-upload steps (extraction, Groq info call, IP lookup)
+CV_PIPELINE_DEADLINE = float(os.getenv("CV_PIPELINE_DEADLINE", "35"))
+# Part of the deadline kept back from the Groq info call for its regex fallback and the save
+CV_INFO_MARGIN = 1.0
+
 class CVViewSet(viewsets.ModelViewSet):
     queryset = CV.objects.all()
     serializer_class = CVSerializer
@@ -19,38 +26,57 @@ class CVViewSet(viewsets.ModelViewSet):
 
         # Extract text and information from CV (optional, can fail gracefully)
         try:
-            from ai.ai_logic import (
-                extract_text_from_pdf,
-                detect_cv_language,
-                extract_cv_information,
-                detect_city_from_ip
-            )
-
-            cv_text = extract_text_from_pdf(cv_instance.file)
-
-            # Detect language
-            language = detect_cv_language(cv_text)
-            cv_instance.detected_language = language
-
-            # Extract CV information (name, phone, city, job titles)
-            extracted_info = extract_cv_information(cv_text)
-            cv_instance.extracted_name = extracted_info.get('name', '')
-            cv_instance.extracted_phone = extracted_info.get('phone', '')
-            cv_instance.extracted_city = extracted_info.get('city', '')
-            cv_instance.extracted_job_titles = extracted_info.get('job_titles', [])
-
-            # Get IP-based city detection
-            client_ip = self.get_client_ip()
-            if client_ip:
-                ip_city = detect_city_from_ip(client_ip)
-                cv_instance.ip_detected_city = ip_city
-
-            cv_instance.save()
+            self.process_cv(cv_instance)
             logger.info(f"CV {cv_instance.id} processed successfully for user {self.request.user.username}")
         except Exception as e:
             logger.error(f"Error extracting CV information: {e}")
             # Don't fail the upload, just log the error
 
+    def process_cv(self, cv):
+        """
+        Fill in language, extracted info and IP city for a saved CV.
+        The IP lookup runs alongside text extraction and the Groq info call, all
+        under CV_PIPELINE_DEADLINE; fields from steps that don't finish stay empty.
+        """
+        from ai.ai_logic import extract_cv_information, detect_city_from_ip
+        from ai.pipeline import run_steps
+        from ai.text_cache import get_cv_text
+
+        client_ip = self.get_client_ip()
+        stop_at = time.monotonic() + CV_PIPELINE_DEADLINE
+        outcome = run_steps({
+            # Extract text and detect language (cached by file hash)
+            'text': (lambda: get_cv_text(cv.file), []),
+            # Extract CV information (name, phone, city, job titles) in whatever time extraction left
+            'info': (lambda text: extract_cv_information(
+                text['text'], timeout=stop_at - time.monotonic() - CV_INFO_MARGIN), ['text']),
+            # Get IP-based city detection
+            'ip_city': (lambda: detect_city_from_ip(client_ip) if client_ip else None, []),
+        }, deadline=CV_PIPELINE_DEADLINE, name=f"cv-{cv.id}")
+        results = outcome['results']
+
+        if 'text' in results:
+            cv.detected_language = results['text']['language']
+        if 'info' in results:
+            extracted_info = results['info']
+            cv.extracted_name = extracted_info.get('name', '')
+            cv.extracted_phone = extracted_info.get('phone', '')
+            cv.extracted_city = extracted_info.get('city', '')
+            cv.extracted_job_titles = extracted_info.get('job_titles', [])
+        if results.get('ip_city') is not None:
+            cv.ip_detected_city = results['ip_city']
+
+        cv.save()
+
+        # Start generating the quiz now, so it is ready when the user asks for it
+        if 'text' in results:
+            from ai.pregeneration import schedule_pregeneration
+
+            try:
+                schedule_pregeneration(cv)
+            except Exception as e:
+                logger.error(f"Could not schedule quiz pre-generation for CV {cv.id}: {e}")
+
     def get_client_ip(self):
         """Extract client IP from request."""
         x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
@@ -79,30 +105,9 @@ class CVViewSet(viewsets.ModelViewSet):
                 file=file
             )
 
-            # Extract information asynchronously (don't fail if this errors)
+            # Extract information (don't fail if this errors)
             try:
-                from ai.ai_logic import (
-                    extract_text_from_pdf,
-                    detect_cv_language,
-                    extract_cv_information,
-                    detect_city_from_ip
-                )
-
-                cv_text = extract_text_from_pdf(cv.file)
-                language = detect_cv_language(cv_text)
-                cv.detected_language = language
-
-                extracted_info = extract_cv_information(cv_text)
-                cv.extracted_name = extracted_info.get('name', '')
-                cv.extracted_phone = extracted_info.get('phone', '')
-                cv.extracted_city = extracted_info.get('city', '')
-                cv.extracted_job_titles = extracted_info.get('job_titles', [])
-
-                client_ip = self.get_client_ip()
-                if client_ip:
-                    cv.ip_detected_city = detect_city_from_ip(client_ip)
-
-                cv.save()
+                self.process_cv(cv)
             except Exception as e:
                 logger.error(f"Error processing CV: {e}")
                 # Continue anyway, just without extracted info
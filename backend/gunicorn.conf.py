@@ -0,0 +1,21 @@
+# Gunicorn settings shared by start_gunicorn.sh and gunicorn.service (ASGI, uvicorn workers).
+# Command-line flags (bind, workers, timeout, logs) still take precedence.
+import gc
+
+# Load the Django app in the master so the workers fork with it already imported
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker forks
+    from ai.warmup import warmup
+
+    warmup()
+    # Keep the garbage collector from touching the shared objects, which would copy their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from ai.warmup import post_fork
+
+    post_fork()
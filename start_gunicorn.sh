@@ -6,9 +6,11 @@ set +a
 cd /home/VeriCV/backend
 
 exec /home/VeriCV/venv/bin/gunicorn \
+    --config gunicorn.conf.py \
     --workers 3 \
+    --worker-class uvicorn_worker.UvicornWorker \
     --bind 127.0.0.1:8000 \
     --timeout 120 \
     --access-logfile /var/log/vericv-access.log \
     --error-logfile /var/log/vericv-error.log \
-    core.wsgi:application
+    core.asgi:application